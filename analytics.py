@@ -0,0 +1,160 @@
+import math
+from utils import CLASS_NAMES
+
+
+def build_lines(lines, cam_name, scale=(1.0, 1.0)):
+    """
+    Đường đếm xe của một camera/video từ cấu hình COUNT_LINES ({cam: [[[x1, y1], [x2, y2]], ...]})
+    scale: (sx, sy) khi frame được decode nhỏ hơn độ phân giải lúc vẽ
+    """
+    sx, sy = scale
+    return [((a[0] * sx, a[1] * sy), (b[0] * sx, b[1] * sy)) for a, b in lines.get(cam_name, [])]
+
+
+def _side(a, b, p):
+    """> 0 nếu p nằm bên phải hướng a -> b trên ảnh (trục y hướng xuống)"""
+    return (b[0] - a[0]) * (p[1] - a[1]) - (b[1] - a[1]) * (p[0] - a[0])
+
+
+def crossing(a, b, p0, p1):
+    """
+    Tâm xe đi từ p0 đến p1 có cắt đoạn a-b không
+    Returns: 1 nếu sang bên phải hướng a -> b, -1 nếu sang bên trái, 0 nếu không cắt
+    """
+    right0, right1 = _side(a, b, p0) > 0, _side(a, b, p1) > 0
+    if right0 == right1 or _side(p0, p1, a) * _side(p0, p1, b) > 0:
+        return 0
+    return 1 if right1 else -1
+
+
+class TrafficStats:
+    """
+    Thống kê giao thông tăng dần cho một camera, gom theo bucket thời gian cố định (bucket_seconds).
+    Theo từng vùng ("all" = cả camera, "zone<i>", "line<i>") và class:
+    - count: số xe khác nhau (theo track id) xuất hiện trong vùng / cắt qua đường trong bucket
+    - crossings_right/left: số lần cắt đường đếm theo hai chiều
+    - dwell: thời gian xe ở trong zone (ở "all": thời gian xe xuất hiện), tính vào bucket lúc xe rời đi
+    - speed: tốc độ tâm box (px/s) lấy mẫu mỗi speed_window giây
+    Chỉ giữ bucket đang mở và trạng thái các track còn sống (track không thấy quá track_ttl giây bị bỏ),
+    nên bộ nhớ không tăng theo thời gian chạy. Bucket đóng được trả về dạng list dòng (dict) để ghi ra sink.
+    """
+
+    def __init__(self, cam_name, lines=(), bucket_seconds=60.0, speed_window=0.5, track_ttl=2.0):
+        self.cam_name = cam_name
+        self.lines = list(lines)
+        self.bucket_seconds = bucket_seconds
+        self.speed_window = speed_window
+        self.track_ttl = track_ttl
+        self.tracks = {}  # track_id -> trạng thái
+        self.bucket = None  # Chỉ số bucket đang mở
+        self.acc = {}  # (vùng, class) -> số liệu của bucket đang mở
+
+    def _acc(self, region, cls):
+        acc = self.acc.get((region, cls))
+        if acc is None:
+            acc = self.acc[(region, cls)] = {
+                'count': 0, 'right': 0, 'left': 0,
+                'dwell_sum': 0.0, 'dwell_n': 0, 'dwell_max': 0.0,
+                'speed_sum': 0.0, 'speed_n': 0, 'speed_max': 0.0
+            }
+        return acc
+
+    def _count(self, state, region):
+        """Đếm xe một lần cho mỗi vùng trong bucket"""
+        if state['bucket'] != self.bucket:
+            state['bucket'] = self.bucket
+            state['counted'] = set()
+        if region not in state['counted']:
+            state['counted'].add(region)
+            self._acc(region, state['cls'])['count'] += 1
+
+    def _dwell(self, region, cls, seconds):
+        acc = self._acc(region, cls)
+        acc['dwell_sum'] += seconds
+        acc['dwell_n'] += 1
+        acc['dwell_max'] = max(acc['dwell_max'], seconds)
+
+    def _speed(self, region, cls, speed):
+        acc = self._acc(region, cls)
+        acc['speed_sum'] += speed
+        acc['speed_n'] += 1
+        acc['speed_max'] = max(acc['speed_max'], speed)
+
+    def _finish(self, state):
+        """Track biến mất: kết thúc lượt ở zone hiện tại và thời gian xuất hiện"""
+        if state['zone'] >= 0:
+            self._dwell(f"zone{state['zone']}", state['cls'], state['last_ts'] - state['zone_ts'])
+        self._dwell("all", state['cls'], state['last_ts'] - state['first_ts'])
+
+    def _rows(self):
+        rows = []
+        for (region, cls), acc in sorted(self.acc.items()):
+            rows.append({
+                "camera": self.cam_name,
+                "timestamp": self.bucket * self.bucket_seconds,
+                "bucket_seconds": self.bucket_seconds,
+                "region": region,
+                "class": cls,
+                "count": acc['count'],
+                "crossings_right": acc['right'],
+                "crossings_left": acc['left'],
+                "dwell_avg": round(acc['dwell_sum'] / acc['dwell_n'], 2) if acc['dwell_n'] else None,
+                "dwell_max": round(acc['dwell_max'], 2) if acc['dwell_n'] else None,
+                "speed_avg": round(acc['speed_sum'] / acc['speed_n'], 1) if acc['speed_n'] else None,
+                "speed_max": round(acc['speed_max'], 1) if acc['speed_n'] else None
+            })
+        self.acc = {}
+        return rows
+
+    def update(self, ts, track_ids, points, classes, zone_ids):
+        """
+        Cập nhật với các track của một frame
+        Args:
+            track_ids, classes, zone_ids: mảng (N,); points: mảng (N, 2) tâm track (ObjectTracker.get_endpoints)
+        Returns: list dòng thống kê của bucket vừa đóng (rỗng nếu bucket chưa đổi)
+        """
+        rows = []
+        bucket = int(ts // self.bucket_seconds)
+        if self.bucket is not None and bucket != self.bucket:
+            rows = self._rows()
+        self.bucket = bucket
+        for track_id, point, cls, zone in zip(track_ids.tolist(), points.tolist(), classes.tolist(),
+                                              zone_ids.tolist()):
+            point = tuple(point)
+            state = self.tracks.get(track_id)
+            if state is None:
+                # Class cố định theo lần thấy đầu tiên để xe không bị đếm ở hai class
+                state = self.tracks[track_id] = {
+                    'cls': CLASS_NAMES.get(cls, str(cls)), 'first_ts': ts, 'last_ts': ts,
+                    'point': point, 'anchor': point, 'anchor_ts': ts,
+                    'zone': zone, 'zone_ts': ts, 'bucket': None, 'counted': set()
+                }
+            elif zone != state['zone']:
+                if state['zone'] >= 0:
+                    self._dwell(f"zone{state['zone']}", state['cls'], state['last_ts'] - state['zone_ts'])
+                state['zone'], state['zone_ts'] = zone, ts
+            regions = ("all", f"zone{zone}") if zone >= 0 else ("all",)
+            for region in regions:
+                self._count(state, region)
+            for i, (a, b) in enumerate(self.lines):
+                side = crossing(a, b, state['point'], point)
+                if side:
+                    self._count(state, f"line{i}")
+                    self._acc(f"line{i}", state['cls'])['right' if side > 0 else 'left'] += 1
+            dt = ts - state['anchor_ts']
+            if dt >= self.speed_window:
+                speed = math.hypot(point[0] - state['anchor'][0], point[1] - state['anchor'][1]) / dt
+                for region in regions:
+                    self._speed(region, state['cls'], speed)
+                state['anchor'], state['anchor_ts'] = point, ts
+            state['point'], state['last_ts'] = point, ts
+        for track_id in [t for t, s in self.tracks.items() if ts - s['last_ts'] > self.track_ttl]:
+            self._finish(self.tracks.pop(track_id))
+        return rows
+
+    def flush(self):
+        """Kết thúc mọi track và trả về bucket đang mở (gọi khi kết thúc nguồn video)"""
+        for state in self.tracks.values():
+            self._finish(state)
+        self.tracks = {}
+        return self._rows() if self.bucket is not None else []
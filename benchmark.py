@@ -0,0 +1,252 @@
+import sys
+import json
+import time
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+import metrics
+from utils import build_zones
+from pipeline import CameraPipeline
+from motion import MotionGate
+from render import draw_overlay, overlay_from_result
+
+# Cấu hình benchmark (giữ nguyên giữa các commit để so sánh được)
+CAMERA_COUNTS = [1, 4, 8]  # Số camera cho mỗi lần chạy
+FRAMES_PER_CAMERA = 600
+FPS = 15  # Dùng để tính timestamp của frame
+FRAME_SHAPE = (720, 1280, 3)
+SEED = 0
+LANES_PER_ZONE = 2  # Số xe chạy song song trong một zone
+WRONG_WAY_RATIO = 0.3  # Tỉ lệ xe đi ngược chiều
+SPEED_RANGE = (4, 10)  # px/frame
+BOX_SIZE_RANGE = (40, 80)  # px
+JITTER_PX = 1.5  # Nhiễu vị trí box của detector giả
+MISS_RATE = 0.02  # Tỉ lệ detection bị bỏ sót
+SYNTH_FRAMES = True  # Vẽ frame giả để chạy cả motion gate và vẽ overlay
+TRACKER_ENGINE = "iou"
+RESULT_FILE = "benchmark.json"
+
+
+def _lane_range(polygon, x, inset=5):
+    """Đoạn y mà đường thẳng đứng tại x nằm trong polygon"""
+    pts = np.asarray(polygon, dtype=np.float64)
+    ys = []
+    for (x1, y1), (x2, y2) in zip(pts, np.roll(pts, -1, axis=0)):
+        if (x1 <= x < x2) or (x2 <= x < x1):
+            ys.append(y1 + (x - x1) * (y2 - y1) / (x2 - x1))
+    if len(ys) < 2:
+        return None
+    return min(ys) + inset, max(ys) - inset
+
+
+class ScriptedScene:
+    """
+    Kịch bản xe chạy thẳng đứng qua các zone của một camera, xác định hoàn toàn bởi seed.
+    Mỗi làn trong zone có lần lượt từng xe, đi theo hướng cho phép hoặc ngược lại (WRONG_WAY_RATIO);
+    tâm xe luôn nằm trong zone nên đáp án vi phạm biết trước.
+    """
+
+    def __init__(self, zones, frames, seed):
+        rng = np.random.default_rng(seed)
+        self.vehicles = []  # dict: zone, x, y0, y1, start, end, size, cls, wrong
+        for zone_id, zone in enumerate(zones):
+            pts = np.asarray(zone['polygon'], dtype=np.float64)
+            xmin, xmax = pts[:, 0].min(), pts[:, 0].max()
+            for lane in range(LANES_PER_ZONE):
+                x = xmin + (xmax - xmin) * (lane + 1) / (LANES_PER_ZONE + 1)
+                span = _lane_range(zone['polygon'], x)
+                if span is None or span[1] - span[0] < 40:
+                    continue
+                t = int(rng.integers(0, 10))
+                while t < frames:
+                    speed = rng.uniform(*SPEED_RANGE)
+                    duration = int((span[1] - span[0]) / speed)
+                    wrong = bool(rng.random() < WRONG_WAY_RATIO)
+                    down = (zone['allowed_direction'] == "going_down") != wrong
+                    y0, y1 = span if down else span[::-1]
+                    self.vehicles.append({
+                        'zone': zone_id, 'x': x, 'y0': y0, 'y1': y1, 'start': t,
+                        'end': min(frames, t + duration), 'duration': duration,
+                        'size': rng.uniform(*BOX_SIZE_RANGE), 'cls': int(rng.choice([2, 3, 5, 7])),
+                        'wrong': wrong
+                    })
+                    t += duration + int(rng.integers(5, 30))
+
+    def boxes(self, frame_idx):
+        """Box thật (xyxy) và class của mọi xe đang xuất hiện ở frame"""
+        boxes, classes = [], []
+        for v in self.vehicles:
+            if v['start'] <= frame_idx < v['end']:
+                y = v['y0'] + (v['y1'] - v['y0']) * (frame_idx - v['start']) / v['duration']
+                half = v['size'] / 2
+                boxes.append((v['x'] - half, y - half, v['x'] + half, y + half))
+                classes.append(v['cls'])
+        return np.array(boxes, dtype=np.float32).reshape(-1, 4), np.array(classes, dtype=int)
+
+
+class ScriptedDetector:
+    """Detector giả: trả lại box của kịch bản kèm nhiễu và bỏ sót, xác định theo (seed, frame)"""
+
+    def __init__(self, scene, seed):
+        self.scene = scene
+        self.seed = seed
+
+    def replay(self, frame_idx):
+        boxes, classes = self.scene.boxes(frame_idx)
+        rng = np.random.default_rng((self.seed, frame_idx))
+        keep = rng.random(len(boxes)) >= MISS_RATE
+        boxes = boxes[keep] + rng.normal(0, JITTER_PX, (int(keep.sum()), 4)).astype(np.float32)
+        conf = rng.uniform(0.5, 0.95, len(boxes)).astype(np.float32)
+        return {'boxes': boxes, 'conf': conf, 'cls': classes[keep]}
+
+
+def score_events(scene, events, enter_frames=3):
+    """
+    So event "open" với xe ngược chiều của kịch bản (cùng zone, lúc mở nằm trong thời gian xe xuất hiện)
+    Returns: (tp, fp, fn)
+    """
+    truth = [v for v in scene.vehicles if v['wrong'] and v['end'] - v['start'] > enter_frames + 2]
+    matched = set()
+    fp = 0
+    for event in events:
+        if event['status'] != "open":
+            continue
+        frame_idx = round(event['start_ts'] * FPS)
+        match = next((i for i, v in enumerate(truth) if i not in matched and v['zone'] == event['zone']
+                      and v['start'] <= frame_idx < v['end']), None)
+        if match is None:
+            fp += 1
+        else:
+            matched.add(match)
+    return len(matched), fp, len(truth) - len(matched)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:  # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+        except ImportError:
+            return None
+
+
+def run(n_cameras, polygons):
+    """Chạy n_cameras camera xen kẽ từng frame trong một process; trả về kết quả đo"""
+    metrics.configure(True, "benchmark", tempfile.mkdtemp(prefix="bench_metrics_"), dump_seconds=3600)
+    metrics.reset()
+    cam_names = sorted(polygons)
+    cameras = []
+    for i in range(n_cameras):
+        cam_name = cam_names[i % len(cam_names)]
+        zones = build_zones(polygons, cam_name)
+        scene = ScriptedScene(zones, FRAMES_PER_CAMERA, SEED + i)
+        cameras.append({
+            'name': f"{cam_name}#{i}", 'zones': zones, 'scene': scene,
+            'detector': ScriptedDetector(scene, SEED + i),
+            'pipeline': CameraPipeline(f"{cam_name}#{i}", zones, tracker_engine=TRACKER_ENGINE),
+            'gate': MotionGate(zones, force_every=FPS) if SYNTH_FRAMES else None,
+            'frame': np.zeros(FRAME_SHAPE, dtype=np.uint8), 'events': [], 'overlay': None
+        })
+    background = np.full(FRAME_SHAPE, 90, dtype=np.uint8)
+    busy = 0.0
+    for frame_idx in range(FRAMES_PER_CAMERA):
+        ts = frame_idx / FPS
+        for cam in cameras:
+            frame = cam['frame']
+            if SYNTH_FRAMES:
+                # Tạo frame không tính vào thời gian đo
+                np.copyto(frame, background)
+                for x1, y1, x2, y2 in cam['scene'].boxes(frame_idx)[0].astype(int):
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), (220, 220, 220), -1)
+            start = time.perf_counter()
+            if cam['gate'] is not None:
+                with metrics.timer("motion"):
+                    detect = cam['gate'].should_detect(frame, force=cam['pipeline'].violation_states.has_active())
+                if not detect:
+                    busy += time.perf_counter() - start
+                    continue
+            with metrics.timer("detect"):
+                detections = cam['detector'].replay(frame_idx)
+            result = cam['pipeline'].process(detections, frame, ts)
+            cam['events'].extend(result['events'])
+            if SYNTH_FRAMES:
+                with metrics.timer("draw"):
+                    draw_overlay(frame, overlay_from_result(result, cam['zones']))
+            busy += time.perf_counter() - start
+    tp = fp = fn = 0
+    for cam in cameras:
+        cam['events'].extend(cam['pipeline'].flush_events())
+        t, f, n = score_events(cam['scene'], cam['events'])
+        tp, fp, fn = tp + t, fp + f, fn + n
+    stages = {hist['name']: {'p50_ms': 1000 * hist['p50'], 'p95_ms': 1000 * hist['p95'],
+                             'p99_ms': 1000 * hist['p99'], 'count': hist['count']}
+              for hist in _merge_cameras(metrics.snapshot()['histograms'])}
+    frames = n_cameras * FRAMES_PER_CAMERA
+    return {
+        'cameras': n_cameras,
+        'frames': frames,
+        'fps': frames / busy if busy else 0.0,
+        'stages': stages,
+        'peak_rss_mb': peak_rss_mb(),
+        'violations': {'tp': tp, 'fp': fp, 'fn': fn,
+                       'precision': tp / (tp + fp) if tp + fp else 1.0,
+                       'recall': tp / (tp + fn) if tp + fn else 1.0}
+    }
+
+
+def _merge_cameras(histograms):
+    """Gộp histogram cùng stage của các camera"""
+    merged = {}
+    for hist in histograms:
+        m = merged.setdefault(hist['name'], {'name': hist['name'], 'buckets': [0] * len(hist['buckets']),
+                                             'count': 0})
+        m['buckets'] = [a + b for a, b in zip(m['buckets'], hist['buckets'])]
+        m['count'] += hist['count']
+    for m in merged.values():
+        for q in metrics.QUANTILES:
+            m[f"p{int(q * 100)}"] = metrics.quantile(m['buckets'], m['count'], q)
+    return list(merged.values())
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    with open('polygons.json', 'r') as f:
+        polygons = json.load(f)
+    results = []
+    for n_cameras in CAMERA_COUNTS:
+        # Mỗi cấu hình một process mới để peak RSS không bị cộng dồn
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run, n_cameras, polygons).result()
+        results.append(result)
+        v = result['violations']
+        stages = " | ".join(f"{name} p50 {s['p50_ms']:.2f} / p95 {s['p95_ms']:.2f} / p99 {s['p99_ms']:.2f} ms"
+                            for name, s in sorted(result['stages'].items()))
+        rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else "n/a"
+        print(f"[{n_cameras} cam] {result['fps']:.0f} frame/s | peak RSS {rss} | "
+              f"vi phạm: precision {v['precision']:.3f} recall {v['recall']:.3f} "
+              f"(tp {v['tp']}, fp {v['fp']}, fn {v['fn']})")
+        print(f"    {stages}")
+    config = {key: globals()[key] for key in (
+        "FRAMES_PER_CAMERA", "FPS", "FRAME_SHAPE", "SEED", "LANES_PER_ZONE", "WRONG_WAY_RATIO",
+        "SPEED_RANGE", "BOX_SIZE_RANGE", "JITTER_PX", "MISS_RATE", "SYNTH_FRAMES", "TRACKER_ENGINE")}
+    with open(RESULT_FILE, "w", encoding="utf-8") as f:
+        json.dump({'commit': git_commit(), 'python': sys.version.split()[0], 'config': config,
+                   'results': results}, f, indent=2)
+    print(f"Kết quả ghi vào {RESULT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,102 +1,251 @@
-import cv2
 import os
 import json
-import threading
 import multiprocessing
 from queue import Queue
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import csv
-from utils import ObjectDetector, ObjectTracker, DirectionAnalyzer
+import time
+from utils import ObjectDetector, build_zones
+from pipeline import CameraPipeline
+from video_io import FileVideoReader
+from event_sink import NDJSONSink, create_sink, STATS_FIELDS
+from render import AsyncRenderer, OverlayEncoder, overlay_from_result
+from motion import MotionGate
+from roi import RoiCropper, detect_rois
+from analytics import build_lines
+from zone_store import ZoneStore
+from models import export_model
+import metrics
 
 # Cấu hình
 VIDEO_FOLDER = r"D:\Python_project\ORBRO\Option1"
 OUTPUT_FOLDER = "output_videos"
-FPS = 25
-VIOLATION_LOG_FILE = "violations.json"
+MAX_WORKERS = 2  # Số process xử lý video song song (mỗi process một model)
+EVENTS_FOLDER = os.path.join(OUTPUT_FOLDER, "events")  # Event vi phạm riêng của từng video
+CHECKPOINT_FILE = os.path.join(OUTPUT_FOLDER, "checkpoint.ndjson")  # Video đã xử lý xong (chạy lại sẽ bỏ qua)
+MODEL_PATH = "yolo11s.pt"
+DEVICE = "cuda:0"
+MODEL_BACKEND = "pytorch"  # "pytorch", hoặc "onnx"/"openvino" (export một lần, cache theo hash weights + imgsz, chạy CPU)
+MODEL_IMGSZ = 640
+MODEL_WARMUP = 2  # Số lần inference khởi động trước frame đầu tiên
+MODEL_WARMUP_SHAPES = [(1080, 1920)]  # Shape (h, w) frame/vùng cắt ROI của video để warm-up đúng input, None = imgsz
+MODEL_CACHE_DIR = "model_cache"
+ANALYSIS_FPS = None  # FPS phân tích mục tiêu (None = mọi frame của video)
+READ_BUFFER_SIZE = 8  # Số frame decode trước
+# Video overlay: "full" (cả video), "clips" (chỉ đoạn quanh vi phạm), None (headless, không vẽ/encode)
+RENDER_MODE = "full"
+CLIP_PRE_SECONDS = 2.0
+CLIP_POST_SECONDS = 3.0
+CLIP_PREROLL_SCALE = 0.5  # Pre-roll giữ frame thu nhỏ (1080p: ~1.5 MB/frame thay vì ~6 MB)
+CLIP_PREROLL_MAX_MB = 64  # Giới hạn bộ nhớ pre-roll
+VIOLATION_LOG_FILE = "violations.ndjson"
 ANALYSIS_CSV_FILE = "analysis.csv"
+# Các sink ghi event vi phạm: "ndjson", "csv", "sqlite"
+VIOLATION_SINKS = [("ndjson", VIOLATION_LOG_FILE), ("csv", ANALYSIS_CSV_FILE)]
+# Thống kê giao thông theo bucket thời gian (số xe theo zone/class, lượt cắt đường đếm, thời gian trong zone,
+# tốc độ px/s); None = tắt. Mốc thời gian là giây tính từ đầu mỗi video
+STATS_BUCKET_SECONDS = 60
+STATS_CSV_FILE = "traffic_stats.csv"
+# Sink ghi thống kê: "csv", "ndjson", "sqlite", "parquet" (cần pyarrow)
+STATS_SINKS = [("csv", STATS_CSV_FILE)]
+# Đường đếm xe theo video (tọa độ như polygons.json), vd {"Road_1.mp4": [[[200, 300], [800, 300]]]}
+COUNT_LINES = {}
+SINK_FLUSH_ITEMS = 100  # Flush khi đủ số event
+SINK_FLUSH_SECONDS = 1.0  # hoặc sau số giây này
+TRACKER_ENGINE = "iou"  # Bộ gán ID: "iou" (NumPy), "bytetrack", "botsort"
+MOTION_GATE = True  # Bỏ qua detector khi trong zone không có chuyển động
+MOTION_FORCE_EVERY = 15  # Dù tĩnh, vẫn detect mỗi số frame này để giữ track
+# Chỉ detect trong vùng zone: "union" (một bbox bao mọi zone), "tiles" (bbox từng nhóm zone), None (cả frame)
+ROI_MODE = None
+ZONES_FILE = "polygons.json"  # Đọc lại khi bắt đầu mỗi video: sửa zone có hiệu lực từ video kế tiếp
+METRICS_ENABLED = False  # Đo thời gian từng stage (tắt = không tốn gì)
+METRICS_PORT = 9100  # http://127.0.0.1:9100/metrics (Prometheus) và /metrics.json
+METRICS_DIR = os.path.join(OUTPUT_FOLDER, "metrics")  # Mỗi process ghi snapshot JSON vào đây định kỳ
+METRICS_DUMP_SECONDS = 5.0
 
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+os.makedirs(EVENTS_FOLDER, exist_ok=True)
 
-# Đọc file JSON chứa các polygon
-with open('polygons.json', 'r') as f:
-    polygons = json.load(f)
+# Cấu hình zone (kiểm tra hợp lệ khi đọc)
+zone_store = ZoneStore(ZONES_FILE)
 
-video_files = [os.path.join(VIDEO_FOLDER, f) for f in os.listdir(VIDEO_FOLDER) if f.endswith('.mp4')]
+video_files = sorted(os.path.join(VIDEO_FOLDER, f) for f in os.listdir(VIDEO_FOLDER) if f.endswith('.mp4'))
 
-violation_log = []  # Dùng chung cho tất cả video
-violation_log_lock = threading.Lock()
+def events_path(video_name):
+    return os.path.join(EVENTS_FOLDER, f"{video_name}.ndjson")
 
-def draw_summary(frame, vehicle_count, person_count):
-    """Vẽ bảng tổng hợp số lượng đối tượng"""
-    cv2.putText(frame, f"Vehicles: {vehicle_count}", (20, 40), 
-                cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
-    cv2.putText(frame, f"Pedestrians: {person_count}", (20, 80), 
-                cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
+def stats_path(video_name):
+    return os.path.join(EVENTS_FOLDER, f"{video_name}.stats.ndjson")
+
+def load_checkpoint():
+    """Tên các video đã xử lý xong ở lần chạy trước (còn file event và thống kê tương ứng)"""
+    done = set()
+    if os.path.exists(CHECKPOINT_FILE):
+        with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    done.add(json.loads(line)["video"])
+    return {name for name in done if os.path.exists(events_path(name))
+            and (not STATS_BUCKET_SECONDS or os.path.exists(stats_path(name)))}
+
+def create_detector():
+    # Model được load/warm-up một lần cho cả process, các video sau dùng lại
+    return ObjectDetector(MODEL_PATH, device=DEVICE, backend=MODEL_BACKEND, imgsz=MODEL_IMGSZ,
+                              warmup=MODEL_WARMUP, cache_dir=MODEL_CACHE_DIR, warmup_shapes=MODEL_WARMUP_SHAPES)
+
+def init_worker():
+    """Khởi tạo process worker: bật metrics, load và warm-up model trước khi nhận video"""
+    metrics.configure(METRICS_ENABLED, "worker", METRICS_DIR, METRICS_DUMP_SECONDS)
+    create_detector()
 
 def process_video(video_path):
+    """
+    Xử lý một video trong process worker. Event vi phạm và thống kê được ghi vào file riêng của video
+    (ghi file tạm, đổi tên khi xong nên file luôn đầy đủ).
+    Returns: dict thống kê {'video', 'frames', 'seconds', 'events', 'worker'}
+    """
+    started = time.time()
     video_name = os.path.basename(video_path)
-    detector = ObjectDetector("yolo11s.pt", device="cuda:0")  # Model riêng cho mỗi thread
-    tracker = ObjectTracker(max_track_length=30)
-    direction_analyzer = DirectionAnalyzer(arrow_scale=3)
-    cap = cv2.VideoCapture(video_path)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    out_path = os.path.join(OUTPUT_FOLDER, f"overlay_{video_name}")
-    out = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), FPS, (width, height))
-    zones = []
-    if video_name in polygons:
-        for zone in polygons[video_name]:
-            zones.append({
-                'polygon': [tuple(pt) for pt in zone['points']],
-                'allowed_direction': f"going_{zone['direction']}"
-            })
+    detector = create_detector()
+    zone_store.poll(force=True)
+    zones = build_zones(zone_store.polygons, video_name)
+    pipeline = CameraPipeline(video_name, zones, tracker_engine=TRACKER_ENGINE,
+                              stats_bucket_seconds=STATS_BUCKET_SECONDS,
+                              count_lines=build_lines(COUNT_LINES, video_name))
+    gate = MotionGate(zones, force_every=MOTION_FORCE_EVERY) if MOTION_GATE else None
+    cropper = RoiCropper(zones, mode=ROI_MODE) if ROI_MODE else None
+    reader = FileVideoReader(video_path, buffer_size=READ_BUFFER_SIZE, target_fps=ANALYSIS_FPS)
+    out_events, out_stats = events_path(video_name), stats_path(video_name)
+    for path in (out_events, out_stats):
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")  # Phần dở của lần chạy bị ngắt
+    violation_sink = NDJSONSink(out_events + ".tmp", flush_items=SINK_FLUSH_ITEMS,
+                                flush_seconds=SINK_FLUSH_SECONDS)
+    stats_sink = NDJSONSink(out_stats + ".tmp", flush_items=SINK_FLUSH_ITEMS, flush_seconds=SINK_FLUSH_SECONDS)
+    event_count = 0
+    renderer = None
+    if RENDER_MODE:
+        # Vẽ + encode trên thread riêng, thread này chỉ lo inference
+        out_path = os.path.join(OUTPUT_FOLDER, f"overlay_{video_name}")
+        renderer = AsyncRenderer(OverlayEncoder(out_path, reader.output_fps, mode=RENDER_MODE,
+                                                pre_seconds=CLIP_PRE_SECONDS, post_seconds=CLIP_POST_SECONDS,
+                                                preroll_scale=CLIP_PREROLL_SCALE,
+                                                preroll_max_mb=CLIP_PREROLL_MAX_MB))
     frame_count = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        # Đảm bảo FPS ổn định
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
-        result = detector.detect_and_track(frame, conf=0.3, iou=0.5)
-        direction_analyzer.draw_zones(frame, zones)
-        if result.boxes and result.boxes.is_track:
-            boxes = result.boxes.xyxy.cpu().numpy()
-            track_ids = result.boxes.id.int().cpu().tolist()
-            classes = result.boxes.cls.int().cpu().tolist()
-            vehicle_count, person_count = detector.count_objects(result)
-            draw_summary(frame, vehicle_count, person_count)
-            tracker.update_tracks(boxes, track_ids)
-            tracker.draw_bboxes_and_ids(frame, boxes, track_ids, classes, detector)
-            direction_analyzer.draw_direction_arrows(frame, track_ids, tracker, zones)
-            for i, track_id in enumerate(track_ids):
-                track = tracker.get_track_history(track_id)
-                is_wrong, zone = direction_analyzer.check_against_flow(track, zones)
-                if is_wrong:
-                    violation_data = {
-                        "camera": video_name,
-                        "timestamp": frame_count / FPS,
-                        "error": "wrong_way",
-                        "track_id": track_id
-                    }
-                    with violation_log_lock:
-                        violation_log.append(violation_data)
-        out.write(frame)
+    infer_time = 0.0
+    track_time = 0.0
+    overlay = None
+    # Frame được decode trước trên thread nền, ts lấy từ PTS của video
+    for frame_idx, ts, frame in reader:
         frame_count += 1
-    cap.release()
-    out.release()
+        with metrics.timer("motion", camera=video_name):
+            skip = gate is not None and not gate.should_detect(frame, force=pipeline.violation_states.has_active())
+        if skip:
+            # Cảnh tĩnh: không chạy detector, overlay giữ kết quả frame trước
+            if renderer is not None and overlay is not None:
+                renderer.submit(frame, overlay)
+            continue
+        start = time.time()
+        detections = detect_rois(detector, [frame], [cropper], conf=0.3, iou=0.5)[0]
+        infer_time += time.time() - start
+        metrics.observe("infer", time.time() - start, camera=video_name)
+        start = time.time()
+        result = pipeline.process(detections, frame, ts)
+        track_time += time.time() - start
+        # Overlay và log dùng chung một kết quả phân tích
+        if renderer is not None:
+            counts = detector.count_objects(result) if len(result['track_ids']) else None
+            overlay = overlay_from_result(result, pipeline.zone_index.zones, counts)
+            renderer.submit(frame, overlay)
+        violation_sink.write_many(result['events'])
+        stats_sink.write_many(result['stats'])
+        event_count += len(result['events'])
+    if renderer is not None:
+        renderer.close()
+    final_events = pipeline.flush_events()
+    violation_sink.write_many(final_events)
+    event_count += len(final_events)
+    violation_sink.close()
+    stats_sink.write_many(pipeline.flush_stats())
+    stats_sink.close()
+    os.replace(out_events + ".tmp", out_events)
+    if STATS_BUCKET_SECONDS:
+        os.replace(out_stats + ".tmp", out_stats)
+    else:
+        os.remove(out_stats + ".tmp")
+    if frame_count:
+        skipped = f" | bỏ qua detect: {100 * gate.skip_ratio:.0f}%" if gate is not None else ""
+        print(f"[{video_name}] {frame_count} frame | infer/frame: {1000 * infer_time / frame_count:.1f} ms | "
+              f"track+analysis/frame: {1000 * track_time / frame_count:.1f} ms{skipped}")
+    metrics.dump()
+    return {'video': video_name, 'frames': frame_count, 'seconds': round(time.time() - started, 3),
+            'events': event_count, 'worker': os.getpid()}
+
+def merge_results(video_names):
+    """
+    Gộp event và thống kê của các video (kể cả video xong ở lần chạy trước) vào các sink chung theo thứ tự
+    tên video, nên kết quả giống nhau bất kể video nào xong trước hay chạy lại bao nhiêu lần
+    """
+    outputs = [(VIOLATION_SINKS, events_path, {})]
+    if STATS_BUCKET_SECONDS:
+        outputs.append((STATS_SINKS, stats_path, {'fields': STATS_FIELDS, 'table': "traffic_stats"}))
+    for specs, video_path, options in outputs:
+        for _, path in specs:
+            if os.path.exists(path):
+                os.remove(path)
+        sink = create_sink(specs, **options, flush_items=SINK_FLUSH_ITEMS, flush_seconds=SINK_FLUSH_SECONDS)
+        for video_name in sorted(video_names):
+            path = video_path(video_name)
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                sink.write_many([json.loads(line) for line in f if line.strip()])
+        sink.close()
 
 def main():
-    # Xử lý đa luồng cho từng video
-    threads = []
-    for video in video_files:
-        t = threading.Thread(target=process_video, args=(video,))
-        t.start()
-        threads.append(t)
-    for t in threads:
-        t.join()
-    # Lưu log vi phạm chung
-    with open(VIOLATION_LOG_FILE, "w") as f:
-        json.dump(violation_log, f, indent=4)
+    metrics.configure(METRICS_ENABLED, "main", METRICS_DIR, METRICS_DUMP_SECONDS)
+    if METRICS_ENABLED:
+        metrics.serve(METRICS_PORT, METRICS_DIR)
+    done = load_checkpoint()
+    pending = [video for video in video_files if os.path.basename(video) not in done]
+    print(f"{len(video_files)} video | {len(done)} đã xong từ lần trước | {len(pending)} cần xử lý | "
+          f"{MAX_WORKERS} worker")
+    if pending and MODEL_BACKEND != "pytorch":
+        # Export một lần ở process chính, các worker chỉ đọc bản cache (không export đồng thời)
+        export_model(MODEL_PATH, MODEL_BACKEND, MODEL_IMGSZ, MODEL_CACHE_DIR)
+    started = time.time()
+    total_frames = 0
+    worker_stats = {}  # pid -> [frame, giây xử lý]
+    # Số process cố định, mỗi process nhận lần lượt video từ hàng đợi và giữ model giữa các video
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=init_worker) as executor, \
+            open(CHECKPOINT_FILE, "a", encoding="utf-8") as checkpoint:
+        futures = {executor.submit(process_video, video): video for video in pending}
+        for i, future in enumerate(as_completed(futures), 1):
+            video_name = os.path.basename(futures[future])
+            try:
+                stats = future.result()
+            except Exception as e:
+                print(f"[{i}/{len(pending)}] {video_name}: lỗi {e!r} (sẽ chạy lại ở lần sau)")
+                continue
+            checkpoint.write(json.dumps(stats, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+            total_frames += stats['frames']
+            worker = worker_stats.setdefault(stats['worker'], [0, 0.0])
+            worker[0] += stats['frames']
+            worker[1] += stats['seconds']
+            elapsed = time.time() - started
+            print(f"[{i}/{len(pending)}] {video_name}: {stats['frames']} frame, {stats['events']} event, "
+                  f"{stats['frames'] / max(stats['seconds'], 1e-6):.1f} frame/s | "
+                  f"tổng {total_frames / max(elapsed, 1e-6):.1f} frame/s")
+    for pid, (frames, seconds) in sorted(worker_stats.items()):
+        print(f"[worker {pid}] {frames} frame | {frames / max(seconds, 1e-6):.1f} frame/s")
+    if METRICS_ENABLED:
+        for line in metrics.summary(metrics.collect(METRICS_DIR)):
+            print(line)
+    # Ghi log vi phạm chung theo thứ tự xác định
+    merge_results(load_checkpoint())
     print("Xử lý xong tất cả video.")
 
 if __name__ == "__main__":
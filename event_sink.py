@@ -0,0 +1,236 @@
+import os
+import csv
+import io
+import json
+import time
+import sqlite3
+import threading
+
+
+class BufferedSink:
+    """
+    Sink ghi event dạng append-only, gom theo lô.
+    Buffer được flush khi đủ flush_items event hoặc sau flush_seconds giây
+    (thread nền đảm bảo event không nằm lâu trong buffer khi stream yên tĩnh).
+    An toàn khi nhiều thread cùng ghi.
+    """
+
+    def __init__(self, flush_items=100, flush_seconds=1.0):
+        self.flush_items = flush_items
+        self.flush_seconds = flush_seconds
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def write(self, event):
+        self.write_many([event])
+
+    def write_many(self, events):
+        with self._lock:
+            self._buffer.extend(events)
+            if (len(self._buffer) >= self.flush_items
+                    or time.monotonic() - self._last_flush >= self.flush_seconds):
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_seconds):
+            self.flush()
+
+    def _write_batch(self, events):
+        raise NotImplementedError
+
+    def close(self):
+        self._closed.set()
+        self.flush()
+
+
+class FileSink(BufferedSink):
+    """Sink ghi nối vào file text, tự xoay vòng file khi vượt max_bytes (giữ backup_count bản cũ)"""
+
+    def __init__(self, path, max_bytes=None, backup_count=5, **policy):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        super().__init__(**policy)
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8", newline="")
+
+    def _write_batch(self, events):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._rotate()
+        self._file.write(self._format(events, self._file.tell() == 0))
+        self._file.flush()
+
+    def _format(self, events, new_file):
+        raise NotImplementedError
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+class NDJSONSink(FileSink):
+    """Mỗi event một dòng JSON (đọc lại được kể cả khi process bị dừng đột ngột)"""
+
+    def _format(self, events, new_file):
+        return "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+
+
+class CSVSink(FileSink):
+    """Ghi event thành các dòng CSV với cột cố định (header ở đầu mỗi file)"""
+
+    def __init__(self, path, fieldnames, **kwargs):
+        self.fieldnames = fieldnames
+        super().__init__(path, **kwargs)
+
+    def _format(self, events, new_file):
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=self.fieldnames, extrasaction="ignore")
+        if new_file:
+            writer.writeheader()
+        writer.writerows(events)
+        return buf.getvalue()
+
+
+class SQLiteSink(BufferedSink):
+    """Ghi event vào SQLite, mỗi lần flush là một transaction"""
+
+    def __init__(self, path, table="violations", **policy):
+        self.table = table
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, camera TEXT, timestamp REAL, "
+            "error TEXT, track_id INTEGER, status TEXT, data TEXT)"
+        )
+        self._conn.commit()
+        super().__init__(**policy)
+
+    def _write_batch(self, events):
+        rows = [(e.get("camera"), e.get("timestamp"), e.get("error"), e.get("track_id"),
+                 e.get("status"), json.dumps(e, ensure_ascii=False)) for e in events]
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT INTO {self.table} (camera, timestamp, error, track_id, status, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def close(self):
+        super().close()
+        self._conn.close()
+
+
+class ParquetSink(BufferedSink):
+    """
+    Ghi event vào file Parquet (cần pyarrow), mỗi lần flush là một row group.
+    Footer chỉ được ghi khi close nên file đọc được sau khi đóng sink (hợp với kết quả offline);
+    file cũ cùng tên bị ghi đè vì Parquet không ghi nối được.
+    """
+
+    def __init__(self, path, fieldnames, **policy):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.fieldnames = fieldnames
+        self._pa = pa
+        self._schema = pa.schema([(name, pa.type_for_alias(FIELD_TYPES.get(name, "string")))
+                                  for name in fieldnames])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        super().__init__(**policy)
+
+    def _write_batch(self, events):
+        columns = {name: [e.get(name) for e in events] for name in self.fieldnames}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+
+    def close(self):
+        super().close()
+        self._writer.close()
+
+
+class MultiSink:
+    """Ghi cùng một event ra nhiều sink"""
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def write(self, event):
+        for sink in self.sinks:
+            sink.write(event)
+
+    def write_many(self, events):
+        if events:
+            for sink in self.sinks:
+                sink.write_many(events)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+VIOLATION_FIELDS = ["camera", "timestamp", "error", "track_id", "zone", "status",
+                    "start_ts", "end_ts", "frames", "peak_conf"]
+# Dòng thống kê theo bucket thời gian (analytics.TrafficStats)
+STATS_FIELDS = ["camera", "timestamp", "bucket_seconds", "region", "class", "count", "crossings_right",
+                "crossings_left", "dwell_avg", "dwell_max", "speed_avg", "speed_max"]
+# Kiểu cột cho sink Parquet (cột không có trong bảng là string)
+FIELD_TYPES = {
+    "timestamp": "float64", "start_ts": "float64", "end_ts": "float64", "peak_conf": "float64",
+    "bucket_seconds": "float64", "dwell_avg": "float64", "dwell_max": "float64",
+    "speed_avg": "float64", "speed_max": "float64",
+    "track_id": "int64", "zone": "int64", "frames": "int64", "count": "int64",
+    "crossings_right": "int64", "crossings_left": "int64"
+}
+
+
+def create_sink(specs, fields=VIOLATION_FIELDS, table="violations", **policy):
+    """
+    Tạo sink từ cấu hình
+    Args:
+        specs: list (kind, path) với kind là "ndjson", "csv", "sqlite" hoặc "parquet" (cần pyarrow)
+        fields: các cột của sink csv/parquet (VIOLATION_FIELDS hoặc STATS_FIELDS)
+        table: tên bảng của sink sqlite
+        policy: flush_items, flush_seconds (và max_bytes, backup_count cho sink file)
+    """
+    file_opts = {k: policy.pop(k) for k in ("max_bytes", "backup_count") if k in policy}
+    sinks = []
+    for kind, path in specs:
+        if kind == "ndjson":
+            sinks.append(NDJSONSink(path, **file_opts, **policy))
+        elif kind == "csv":
+            sinks.append(CSVSink(path, fields, **file_opts, **policy))
+        elif kind == "sqlite":
+            sinks.append(SQLiteSink(path, table=table, **policy))
+        elif kind == "parquet":
+            sinks.append(ParquetSink(path, fields, **policy))
+        else:
+            raise ValueError(f"Loại sink không hỗ trợ: {kind}")
+    return MultiSink(sinks)
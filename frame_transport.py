@@ -0,0 +1,140 @@
+import re
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+SLOT_FREE = 0
+SLOT_BUSY = 1
+_HEADER_ALIGN = 64
+_META_BYTES = 64  # Sau mảng trạng thái: kích thước gốc của stream (w, h) trước khi decode thu nhỏ
+
+
+def ring_name(prefix, cam_name, generation=0):
+    """Tên segment shared memory của camera (generation tăng mỗi lần camera được thêm lại)"""
+    return f"{prefix}_{re.sub(r'[^0-9A-Za-z]', '_', cam_name)}_{generation}"
+
+
+def _attach_shm(name):
+    """Attach segment có sẵn mà không để resource tracker của process này unlink nó khi thoát"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedFrameRing:
+    """
+    Ring các slot frame BGR trong một segment shared memory (mỗi camera một ring).
+    Chỉ descriptor nhỏ (cam, ring, slot, ts, seq, shape) đi qua queue; frame không bị pickle/copy.
+    Đầu segment là mảng trạng thái slot: producer lấy slot FREE bằng acquire(),
+    consumer cuối cùng của frame trả slot bằng release().
+    """
+
+    def __init__(self, name, n_slots, shape, create=False, source_size=None):
+        self.name = name
+        self.n_slots = n_slots
+        self.shape = tuple(shape)
+        header = -(-n_slots // _HEADER_ALIGN) * _HEADER_ALIGN
+        size = header + _META_BYTES + n_slots * int(np.prod(self.shape))
+        if create:
+            unlink_ring(name)  # Dọn segment sót lại từ lần chạy trước
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = _attach_shm(name)
+        self.states = np.ndarray((n_slots,), dtype=np.uint8, buffer=self.shm.buf)
+        self._meta = np.ndarray((2,), dtype=np.int32, buffer=self.shm.buf, offset=header)
+        self.frames = np.ndarray((n_slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf,
+                                 offset=header + _META_BYTES)
+        if create:
+            self.reset()
+            self._meta[:] = source_size if source_size is not None else (self.shape[1], self.shape[0])
+
+    @classmethod
+    def create(cls, name, n_slots, shape, source_size=None):
+        """Phía producer: tạo ring với mọi slot trống (source_size: (w, h) gốc nếu frame đã được thu nhỏ)"""
+        return cls(name, n_slots, shape, create=True, source_size=source_size)
+
+    @property
+    def source_size(self):
+        return int(self._meta[0]), int(self._meta[1])
+
+    def acquire(self):
+        """Lấy một slot trống, trả về None nếu consumer chưa trả slot nào"""
+        free = np.flatnonzero(self.states == SLOT_FREE)
+        if len(free) == 0:
+            return None
+        slot = int(free[0])
+        self.states[slot] = SLOT_BUSY
+        return slot
+
+    def release(self, slot):
+        self.states[slot] = SLOT_FREE
+
+    def reset(self):
+        """Đánh dấu mọi slot là trống (khi consumer giữ slot bị crash)"""
+        self.states[:] = SLOT_FREE
+
+    def close(self):
+        self.states = None
+        self._meta = None
+        self.frames = None
+        self.shm.close()
+
+
+def unlink_ring(name):
+    """Xóa segment shared memory của ring (nếu còn)"""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+class FrameRingClient:
+    """
+    Phía consumer (analyzer, render): attach ring theo tên trong descriptor khi gặp lần đầu,
+    đọc frame trực tiếp từ slot và trả slot cho producer. Consumer không cần biết trước
+    danh sách camera nên camera có thể được thêm/bớt khi hệ thống đang chạy.
+    """
+
+    def __init__(self, n_slots):
+        self.n_slots = n_slots
+        self.rings = {}
+        self.last_used = {}
+
+    def view(self, ring, slot, shape):
+        """Frame trong slot (view, không copy) - chỉ hợp lệ đến khi release"""
+        attached = self.rings.get(ring)
+        if attached is None:
+            attached = self.rings[ring] = SharedFrameRing(ring, self.n_slots, shape)
+        self.last_used[ring] = time.monotonic()
+        return attached.frames[slot]
+
+    def release(self, ring, slot):
+        self.rings[ring].release(slot)
+
+    def in_flight(self, ring):
+        """Số slot của ring đang bị giữ (frame đã decode, chưa được consumer cuối cùng trả)"""
+        return int(np.count_nonzero(self.rings[ring].states == SLOT_BUSY))
+
+    def zone_scale(self, ring):
+        """Hệ số (sx, sy) từ tọa độ gốc của stream (polygons.json) sang frame trong ring"""
+        attached = self.rings[ring]
+        src_w, src_h = attached.source_size
+        return attached.shape[1] / src_w, attached.shape[0] / src_h
+
+    def prune(self, max_idle=60.0):
+        """Bỏ attach các ring lâu không dùng (camera đã bị gỡ hoặc chuyển sang worker khác)"""
+        now = time.monotonic()
+        for ring in [r for r, t in self.last_used.items() if now - t > max_idle]:
+            self.rings.pop(ring).close()
+            del self.last_used[ring]
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}
+        self.last_used = {}
@@ -0,0 +1,281 @@
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Biên bucket histogram (giây): tăng theo cấp số nhân 1.25 từ 10 µs đến ~10 s
+BUCKETS = [1e-5 * 1.25 ** i for i in range(62)]
+QUANTILES = (0.5, 0.95, 0.99)
+
+_enabled = False
+_role = "main"
+_dump_dir = "metrics"
+_utilization = {}
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [counts, sum, count]
+_counters = {}  # (name, labels) -> giá trị
+_gauges = {}  # (name, labels) -> giá trị
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _observe(self.name, time.perf_counter() - self.start, self.labels)
+        return False
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _observe(name, seconds, labels):
+    key = (name, _key(labels))
+    idx = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        hist[0][idx] += 1
+        hist[1] += seconds
+        hist[2] += 1
+
+
+def enabled():
+    return _enabled
+
+
+def timer(name, **labels):
+    """Đo thời gian một stage: with metrics.timer("infer", camera=cam): ..."""
+    if not _enabled:
+        return _NOOP
+    return _Timer(name, labels)
+
+
+def observe(name, seconds, **labels):
+    """Ghi một thời lượng đã đo sẵn vào histogram của stage"""
+    if _enabled:
+        _observe(name, seconds, labels)
+
+
+def inc(name, value=1, **labels):
+    """Tăng counter (vd số frame bị bỏ)"""
+    if not _enabled:
+        return
+    key = (name, _key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Gán giá trị gauge (vd độ sâu queue)"""
+    if not _enabled:
+        return
+    with _lock:
+        _gauges[(name, _key(labels))] = value
+
+
+def reset():
+    """Xóa mọi số liệu đã ghi của process"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+def quantile(counts, total, q):
+    """Ước lượng phân vị từ số đếm bucket (nội suy tuyến tính trong bucket)"""
+    if total == 0:
+        return 0.0
+    rank = q * total
+    cumulative = 0
+    for i, c in enumerate(counts):
+        if cumulative + c >= rank and c > 0:
+            lower = BUCKETS[i - 1] if i > 0 else 0.0
+            upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+            return lower + (upper - lower) * (rank - cumulative) / c
+        cumulative += c
+    return BUCKETS[-1]
+
+
+def _update_utilization(state):
+    """CPU (%) của process và GPU (nếu torch đã được load, có CUDA) làm gauge"""
+    now, cpu = time.monotonic(), time.process_time()
+    if state:
+        wall = now - state['wall']
+        if wall > 0:
+            set_gauge("cpu_percent", 100.0 * (cpu - state['cpu']) / wall)
+    state['wall'], state['cpu'] = now, cpu
+    torch = sys.modules.get("torch")  # Không tự import torch chỉ để đo
+    if torch is not None and torch.cuda.is_available():
+        set_gauge("gpu_memory_bytes", torch.cuda.memory_allocated())
+        try:
+            set_gauge("gpu_percent", torch.cuda.utilization())
+        except Exception:
+            pass  # Cần pynvml
+
+
+def snapshot():
+    """Trạng thái metrics của process dạng dict (ghi JSON được)"""
+    with _lock:
+        histograms = [
+            {'name': name, 'labels': dict(labels), 'buckets': list(counts), 'sum': total_time, 'count': count,
+             **{f"p{int(q * 100)}": quantile(counts, count, q) for q in QUANTILES}}
+            for (name, labels), (counts, total_time, count) in _histograms.items()
+        ]
+        counters = [{'name': n, 'labels': dict(l), 'value': v} for (n, l), v in _counters.items()]
+        gauges = [{'name': n, 'labels': dict(l), 'value': v} for (n, l), v in _gauges.items()]
+    return {'process': f"{_role}-{os.getpid()}", 'time': time.time(),
+            'histograms': histograms, 'counters': counters, 'gauges': gauges}
+
+
+def dump():
+    """Ghi snapshot của process ra file ngay (gọi thêm khi process sắp kết thúc)"""
+    if not _enabled:
+        return
+    _update_utilization(_utilization)
+    path = os.path.join(_dump_dir, f"{_role}-{os.getpid()}.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _dump_loop(dump_seconds):
+    while True:
+        time.sleep(dump_seconds)
+        dump()
+
+
+def configure(enabled=False, role="main", dump_dir="metrics", dump_seconds=5.0):
+    """
+    Bật metrics cho process hiện tại (gọi ở đầu mỗi process). Khi tắt, các hàm đo trả về ngay.
+    Mỗi process ghi snapshot JSON vào dump_dir/<role>-<pid>.json mỗi dump_seconds giây;
+    endpoint HTTP của process chính gộp các file này.
+    """
+    global _enabled, _role, _dump_dir
+    _enabled = enabled
+    _role = role
+    _dump_dir = dump_dir
+    if enabled:
+        os.makedirs(dump_dir, exist_ok=True)
+        threading.Thread(target=_dump_loop, args=(dump_seconds,), daemon=True).start()
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def collect(dump_dir, max_age=60.0):
+    """Snapshot của mọi process còn cập nhật trong dump_dir"""
+    snapshots = []
+    now = time.time()
+    for name in sorted(os.listdir(dump_dir)) if os.path.isdir(dump_dir) else []:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(dump_dir, name), "r", encoding="utf-8") as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if now - snap['time'] <= max_age:
+            snapshots.append(snap)
+    return snapshots
+
+
+def prometheus_text(snapshots):
+    """Định dạng text exposition của Prometheus, thêm nhãn process cho từng snapshot"""
+    families = {}  # tên -> (loại, dòng mẫu); mẫu của một metric phải liền nhau
+    for snap in snapshots:
+        for hist in snap['histograms']:
+            name = f"stage_{hist['name']}_seconds"
+            labels = {'process': snap['process'], **hist['labels']}
+            lines = families.setdefault(name, ("histogram", []))[1]
+            cumulative = 0
+            for bound, c in zip(BUCKETS + [float("inf")], hist['buckets']):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else f"{bound:.6g}"
+                lines.append(f"{name}_bucket{_labels_text({**labels, 'le': le})} {cumulative}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {hist['sum']:.6f}")
+            lines.append(f"{name}_count{_labels_text(labels)} {hist['count']}")
+            quantiles = families.setdefault(f"{name}_quantile", ("gauge", []))[1]
+            for q in QUANTILES:
+                quantiles.append(f"{name}_quantile{_labels_text({**labels, 'quantile': q})} "
+                                 f"{hist[f'p{int(q * 100)}']:.6f}")
+        for kind, items in (("counter", snap['counters']), ("gauge", snap['gauges'])):
+            for item in items:
+                name = item['name']
+                families.setdefault(name, (kind, []))[1].append(
+                    f"{name}{_labels_text({'process': snap['process'], **item['labels']})} {item['value']}")
+    out = []
+    for name, (kind, lines) in families.items():
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+def summary(snapshots):
+    """Bảng p50/p95/p99 (ms) theo stage, gộp mọi process và camera"""
+    merged = {}
+    for snap in snapshots:
+        for hist in snap['histograms']:
+            counts, total = merged.setdefault(hist['name'], [[0] * (len(BUCKETS) + 1), 0])
+            merged[hist['name']][0] = [a + b for a, b in zip(counts, hist['buckets'])]
+            merged[hist['name']][1] = total + hist['count']
+    return [f"[metrics] {name}: n={total} | " +
+            " | ".join(f"p{int(q * 100)} {1000 * quantile(counts, total, q):.2f} ms" for q in QUANTILES)
+            for name, (counts, total) in sorted(merged.items())]
+
+
+def serve(port=9100, dump_dir="metrics", host="127.0.0.1"):
+    """
+    Endpoint HTTP cục bộ (thread nền): /metrics (Prometheus) và /metrics.json,
+    gộp snapshot của mọi process ghi vào dump_dir
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            snapshots = collect(dump_dir)
+            if self.path == "/metrics":
+                body, content_type = prometheus_text(snapshots), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(snapshots), "application/json"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
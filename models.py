@@ -0,0 +1,115 @@
+import os
+import shutil
+import hashlib
+import threading
+import time
+import numpy as np
+
+_STARTED = time.monotonic()  # Mốc tính thời gian khởi động của process
+_registry = {}  # (model_path, backend, imgsz, device) -> entry
+_lock = threading.Lock()
+
+# Định dạng export của ultralytics cho từng backend CPU tối ưu
+EXPORT_FORMATS = {"onnx": "onnx", "openvino": "openvino"}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-1 nội dung file weights (khóa cache export, đổi weights -> export lại)"""
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def export_model(model_path, backend, imgsz=640, cache_dir="model_cache"):
+    """
+    Export model sang backend CPU tối ưu (ONNX/OpenVINO) và cache theo hash weights + imgsz.
+    Export với shape động (batch và kích thước ảnh) vì analyzer chạy batch nhiều frame/vùng ROI một lần.
+    Lần chạy sau dùng lại bản đã export, không phải export lại.
+    Returns: đường dẫn model đã export (file .onnx hoặc thư mục OpenVINO)
+    """
+    from ultralytics import YOLO
+
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    key = f"{stem}-{file_hash(model_path)[:12]}-{imgsz}-dyn"
+    suffix = ".onnx" if backend == "onnx" else "_openvino_model"
+    cached = os.path.join(cache_dir, key + suffix)
+    if os.path.exists(cached):
+        return cached
+    os.makedirs(cache_dir, exist_ok=True)
+    start = time.monotonic()
+    exported = YOLO(model_path).export(format=EXPORT_FORMATS[backend], imgsz=imgsz, dynamic=True)
+    # Ghi vào tên tạm rồi đổi tên để process khác không đọc phải bản export dở
+    tmp = f"{cached}.tmp{os.getpid()}"
+    shutil.move(str(exported), tmp)
+    os.replace(tmp, cached)
+    print(f"[model] export {model_path} -> {cached} ({time.monotonic() - start:.1f}s)")
+    return cached
+
+
+def input_size(shapes, imgsz=640, stride=32):
+    """
+    Kích thước input (h, w) của model cho một batch ảnh có các shape (h, w): ảnh lớn nhất sau khi thu về
+    cạnh dài tối đa imgsz, làm tròn lên bội số stride (không vượt imgsz, không phóng to ảnh nhỏ).
+    """
+    height = width = 0.0
+    for h, w in shapes:
+        scale = min(1.0, imgsz / max(h, w))
+        height, width = max(height, h * scale), max(width, w * scale)
+    height = min(imgsz, -(-int(np.ceil(height)) // stride) * stride)
+    width = min(imgsz, -(-int(np.ceil(width)) // stride) * stride)
+    return height, width
+
+
+def get_model(model_path="yolo11s.pt", backend="pytorch", imgsz=640, device="cuda:0", warmup=1,
+              cache_dir="model_cache", warmup_batch=1, warmup_shapes=None):
+    """
+    Lấy model từ registry của process: mỗi (model, backend, imgsz, device) chỉ được load và warm-up một lần,
+    các ObjectDetector sau dùng chung.
+    Args:
+        backend: "pytorch" (weights gốc) hoặc "onnx"/"openvino" (export + cache, chạy trên CPU)
+        warmup: số lần inference khởi động trên batch warmup_batch ảnh rỗng ở mỗi shape input
+                (batch và shape như lúc chạy thật để backend chuẩn bị sẵn shape đó)
+        warmup_shapes: list shape (h, w) của ảnh sẽ đưa vào model (frame hoặc vùng cắt ROI); warm-up ở
+                       input_size của từng shape và của cả list (batch trộn nhiều cam). None = imgsz x imgsz
+    Returns: dict {'model', 'lock', 'imgsz', 'device', 'load_time', 'warmup_time'}
+    """
+    if backend != "pytorch":
+        device = "cpu"
+    key = (model_path, backend, imgsz, device)
+    with _lock:
+        entry = _registry.get(key)
+        if entry is not None:
+            return entry
+        from ultralytics import YOLO
+
+        start = time.monotonic()
+        path = export_model(model_path, backend, imgsz, cache_dir) if backend != "pytorch" else model_path
+        model = YOLO(path, task="detect")
+        load_time = time.monotonic() - start
+        start = time.monotonic()
+        shapes = list(warmup_shapes or [(imgsz, imgsz)])
+        sizes = sorted({input_size([shape], imgsz) for shape in shapes} | {input_size(shapes, imgsz)})
+        for size in sizes:
+            blank = [np.zeros((*size, 3), dtype=np.uint8)] * max(1, warmup_batch)
+            for _ in range(warmup):
+                model.predict(blank, imgsz=size, device=device, verbose=False)
+        warmup_time = time.monotonic() - start
+        entry = _registry[key] = {
+            'model': model,
+            'lock': threading.Lock(),  # Model ultralytics không an toàn khi nhiều thread cùng predict
+            'imgsz': imgsz,
+            'device': device,
+            'load_time': load_time,
+            'warmup_time': warmup_time,
+        }
+        print(f"[model] {model_path} ({backend}, {imgsz}, {device}): load {load_time:.2f}s | "
+              f"warm-up {warmup} lần x batch {max(1, warmup_batch)} x input {sizes} {warmup_time:.2f}s | "
+              f"từ lúc khởi động {since_start():.2f}s")
+        return entry
+
+
+def since_start():
+    """Số giây từ lúc process import module này"""
+    return time.monotonic() - _STARTED
@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Bước lọc rẻ trước detector: có chuyển động trong các zone của camera thì mới chạy YOLO.
+    - So sánh frame xám thu nhỏ (rộng width px) với nền trung bình trượt (accumulateWeighted)
+    - Chỉ xét pixel nằm trong hợp các polygon zone (cả frame nếu camera không có zone)
+    - Có chuyển động -> detect, và tiếp tục detect thêm hold_frames frame sau khi hết chuyển động
+    - Dù tĩnh, vẫn detect mỗi force_every frame để giữ track sống
+    """
+
+    def __init__(self, zones, width=160, threshold=25, min_ratio=0.002, force_every=15, hold_frames=3,
+                 learning_rate=0.05):
+        self.zones = zones
+        self.width = width
+        self.threshold = threshold
+        self.min_ratio = min_ratio
+        self.force_every = force_every
+        self.hold_frames = hold_frames
+        self.learning_rate = learning_rate
+        self.background = None
+        self.mask = None
+        self.mask_pixels = 0
+        self.frame_shape = None
+        self.since_detect = force_every  # Frame đầu tiên luôn được detect
+        self.hold = 0
+        self.frames = 0
+        self.detections = 0
+
+    def _build_mask(self, frame_shape):
+        """Mask hợp các zone ở kích thước thu nhỏ"""
+        h, w = frame_shape[:2]
+        scale = self.width / w
+        size = (self.width, max(1, int(round(h * scale))))
+        if not self.zones:
+            mask = np.full((size[1], size[0]), 255, dtype=np.uint8)
+        else:
+            mask = np.zeros((size[1], size[0]), dtype=np.uint8)
+            polys = [np.round(np.asarray(zone['polygon'], dtype=np.float64) * scale).astype(np.int32)
+                     for zone in self.zones]
+            cv2.fillPoly(mask, polys, 255)
+        self.frame_shape = frame_shape[:2]
+        self.size = size
+        self.mask = mask
+        self.mask_pixels = max(1, cv2.countNonZero(mask))
+        self.background = None
+
+    def set_zones(self, zones):
+        """Đổi zone khi đang chạy: chỉ dựng lại mask, giữ nền đã học"""
+        self.zones = zones
+        if self.frame_shape is not None:
+            background = self.background
+            self._build_mask(self.frame_shape)
+            self.background = background
+
+    def motion_ratio(self, frame):
+        """Tỉ lệ pixel trong zone khác nền; cập nhật nền bằng frame hiện tại"""
+        if self.mask is None or frame.shape[:2] != self.frame_shape:
+            self._build_mask(frame.shape)
+        gray = cv2.cvtColor(cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+            return 1.0
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        _, moving = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        return cv2.countNonZero(cv2.bitwise_and(moving, self.mask)) / self.mask_pixels
+
+    def should_detect(self, frame, force=False):
+        """
+        Args:
+            force: bắt buộc detect (vd camera đang có episode vi phạm mở)
+        Returns: True nếu nên chạy detector cho frame này
+        """
+        self.frames += 1
+        self.since_detect += 1
+        if self.motion_ratio(frame) >= self.min_ratio:
+            self.hold = self.hold_frames
+        elif self.hold > 0:
+            self.hold -= 1
+        elif not force and self.since_detect < self.force_every:
+            return False
+        self.since_detect = 0
+        self.detections += 1
+        return True
+
+    @property
+    def skip_ratio(self):
+        return 1.0 - self.detections / self.frames if self.frames else 0.0
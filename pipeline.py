@@ -0,0 +1,68 @@
+import metrics
+from utils import ObjectTracker, DirectionAnalyzer, ZoneIndex
+from tracking import create_track_engine
+from violations import ViolationStateMachine
+from analytics import TrafficStats
+
+
+class CameraPipeline:
+    """
+    Xử lý sau detection cho một camera: gán ID -> lịch sử track -> zone -> hướng/vi phạm.
+    Giữ toàn bộ trạng thái riêng của camera; kết quả mỗi frame được tính một lần
+    rồi dùng chung cho overlay, log và thống kê (bật khi có stats_bucket_seconds).
+    """
+
+    def __init__(self, cam_name, zones, tracker_engine="iou", max_track_length=30, arrow_scale=3,
+                 violation_enter_frames=3, violation_exit_frames=5, stats_bucket_seconds=None, count_lines=()):
+        self.cam_name = cam_name
+        self.track_engine = create_track_engine(tracker_engine)
+        self.tracker = ObjectTracker(max_track_length=max_track_length)
+        self.direction_analyzer = DirectionAnalyzer(arrow_scale=arrow_scale)
+        self.zone_index = ZoneIndex(zones)
+        self.violation_states = ViolationStateMachine(cam_name, enter_frames=violation_enter_frames,
+                                                      exit_frames=violation_exit_frames)
+        self.stats = TrafficStats(cam_name, count_lines, stats_bucket_seconds) if stats_bucket_seconds else None
+
+    def process(self, detections, frame, ts):
+        """
+        Args:
+            detections: dict {'boxes', 'conf', 'cls'} từ ObjectDetector.detect
+        Returns: dict tracks {'boxes', 'track_ids', 'conf', 'cls'} + 'analysis' (analyze_frame),
+                 'events' (event vi phạm phát sinh ở frame này), 'violation_active' (có episode vi phạm đang
+                 mở, đã qua hysteresis), 'stats' (dòng thống kê của bucket vừa đóng) và 'ts'
+        """
+        cam = self.cam_name
+        with metrics.timer("track", camera=cam):
+            tracks = self.track_engine.update(detections, frame)
+            track_ids = tracks['track_ids'].tolist()
+            # Cập nhật mọi frame để track cũ được xóa đúng hạn
+            self.direction_analyzer.forget(self.tracker.update_tracks(tracks['boxes'], track_ids))
+            first, last, lengths = self.tracker.get_endpoints(track_ids)
+        with metrics.timer("zones", camera=cam):
+            zone_ids = self.zone_index.locate(last)
+        with metrics.timer("direction", camera=cam):
+            analysis = self.direction_analyzer.analyze_frame(
+                first, last, lengths, zone_ids, self.zone_index.allowed_directions)
+        tracks['analysis'] = analysis
+        with metrics.timer("violations", camera=cam):
+            tracks['events'] = self.violation_states.update(
+                ts, tracks['track_ids'], zone_ids, analysis['wrong_way'], tracks['conf'])
+        tracks['violation_active'] = self.violation_states.has_active()
+        tracks['stats'] = []
+        if self.stats is not None:
+            with metrics.timer("stats", camera=cam):
+                tracks['stats'] = self.stats.update(ts, tracks['track_ids'], last, tracks['cls'], zone_ids)
+        tracks['ts'] = ts
+        return tracks
+
+    def set_zones(self, zones):
+        """Đổi zone khi đang chạy: biên dịch index mới rồi thay một lần, giữ nguyên track và episode"""
+        self.zone_index = ZoneIndex(zones)
+
+    def flush_events(self):
+        """Đóng các episode vi phạm còn mở (gọi khi kết thúc nguồn video)"""
+        return self.violation_states.flush()
+
+    def flush_stats(self):
+        """Dòng thống kê của bucket đang mở (gọi khi kết thúc nguồn video hoặc bỏ camera)"""
+        return self.stats.flush() if self.stats is not None else []
@@ -0,0 +1,151 @@
+import os
+import cv2
+import threading
+from collections import deque
+from queue import Queue
+import metrics
+from utils import ObjectTracker, DirectionAnalyzer
+
+
+def overlay_from_result(result, zones, counts=None):
+    """
+    Gói dữ liệu cần để vẽ overlay từ kết quả CameraPipeline.process
+    (mảng nhỏ, gửi được qua queue; không cần frame đã bị analyzer vẽ lên)
+    """
+    analysis = result['analysis']
+    return {
+        'boxes': result['boxes'],
+        'track_ids': result['track_ids'],
+        'cls': result['cls'],
+        'analysis': {key: analysis[key] for key in
+                     ('direction', 'arrow_start', 'arrow_end', 'has_arrow', 'wrong_way')},
+        'zones': zones,
+        'counts': counts,
+        'violation_active': result['violation_active']
+    }
+
+
+def draw_summary(frame, vehicle_count, person_count):
+    """Vẽ bảng tổng hợp số lượng đối tượng"""
+    cv2.putText(frame, f"Vehicles: {vehicle_count}", (20, 40),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
+    cv2.putText(frame, f"Pedestrians: {person_count}", (20, 80),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
+
+
+def draw_overlay(frame, overlay):
+    """Vẽ zone, bounding box, ID, mũi tên hướng (và bảng đếm nếu có) lên frame"""
+    DirectionAnalyzer.draw_zones(frame, overlay['zones'])
+    track_ids = overlay['track_ids'].tolist()
+    if track_ids:
+        ObjectTracker.draw_bboxes_and_ids(frame, overlay['boxes'], track_ids, overlay['cls'].tolist())
+        DirectionAnalyzer.draw_analysis(frame, track_ids, overlay['analysis'])
+    if overlay['counts'] is not None:
+        draw_summary(frame, *overlay['counts'])
+
+
+class OverlayEncoder:
+    """
+    Ghi video overlay của một nguồn:
+    - mode "full": ghi mọi frame vào path
+    - mode "clips": chỉ ghi các đoạn quanh episode vi phạm (pre_seconds trước, post_seconds sau)
+      thành các file <tên>_clip<số>.mp4. Pre-roll được giữ ở kích thước thu nhỏ preroll_scale
+      và tối đa preroll_max_mb MB (ít frame hơn pre_seconds nếu frame quá lớn)
+    """
+
+    def __init__(self, path, fps, mode="full", pre_seconds=2.0, post_seconds=3.0, preroll_scale=0.5,
+                 preroll_max_mb=64):
+        self.path = path
+        self.fps = fps
+        self.mode = mode
+        self.post_frames = max(1, int(post_seconds * fps))
+        self.preroll_frames = max(1, int(pre_seconds * fps))
+        self.preroll_scale = preroll_scale
+        self.preroll_max_mb = preroll_max_mb
+        self.preroll = None  # Tạo khi biết kích thước frame
+        self.writer = None
+        self.remaining = 0
+        self.clip_count = 0
+
+    def _open(self, path, frame):
+        h, w = frame.shape[:2]
+        return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (w, h))
+
+    def _keep(self, frame):
+        """Giữ bản thu nhỏ của frame trong pre-roll"""
+        if self.preroll_scale < 1:
+            small = cv2.resize(frame, None, fx=self.preroll_scale, fy=self.preroll_scale,
+                               interpolation=cv2.INTER_AREA)
+        else:
+            small = frame.copy()
+        if self.preroll is None:
+            limit = int(self.preroll_max_mb * 1024 * 1024) // small.nbytes
+            self.preroll = deque(maxlen=max(1, min(self.preroll_frames, limit)))
+        self.preroll.append(small)
+
+    def write(self, frame, violation_active=False):
+        """violation_active: cam đang có episode vi phạm mở (không phải cờ vi phạm thô của từng frame)"""
+        if self.mode == "full":
+            if self.writer is None:
+                self.writer = self._open(self.path, frame)
+            self.writer.write(frame)
+            return
+        if violation_active:
+            self.remaining = self.post_frames
+            if self.writer is None:
+                stem, ext = os.path.splitext(self.path)
+                self.clip_count += 1
+                self.writer = self._open(f"{stem}_clip{self.clip_count:03d}{ext}", frame)
+                h, w = frame.shape[:2]
+                for old in self.preroll or ():
+                    self.writer.write(old if old.shape == frame.shape else cv2.resize(old, (w, h)))
+                if self.preroll is not None:
+                    self.preroll.clear()
+        if self.writer is not None:
+            self.writer.write(frame)
+            if not violation_active:
+                self.remaining -= 1
+                if self.remaining <= 0:
+                    self.writer.release()
+                    self.writer = None
+        else:
+            self._keep(frame)
+
+    def release(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+        if self.preroll is not None:
+            self.preroll.clear()
+
+
+class AsyncRenderer:
+    """
+    Vẽ overlay và encode video trên thread riêng để thread inference không phải chờ
+    (OpenCV nhả GIL khi vẽ/encode). Frame được copy khi submit vì buffer đọc sẽ bị dùng lại.
+    """
+
+    def __init__(self, encoder, queue_size=32):
+        self.encoder = encoder
+        self._queue = Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._render_loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, overlay):
+        self._queue.put((frame.copy(), overlay))
+
+    def _render_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            frame, overlay = item
+            with metrics.timer("draw"):
+                draw_overlay(frame, overlay)
+            with metrics.timer("encode"):
+                self.encoder.write(frame, overlay['violation_active'])
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self.encoder.release()
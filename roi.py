@@ -0,0 +1,129 @@
+import numpy as np
+from tracking import iou_matrix
+
+
+def _bbox(points, margin, width, height):
+    pts = np.asarray(points, dtype=np.float64)
+    x1, y1 = np.floor(pts.min(axis=0) - margin).astype(int).tolist()
+    x2, y2 = np.ceil(pts.max(axis=0) + margin).astype(int).tolist()
+    return (max(0, x1), max(0, y1), min(width, x2), min(height, y2))
+
+
+def _union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _area(box):
+    return max(0, box[2] - box[0]) * max(0, box[3] - box[1])
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def zone_rois(zones, frame_shape, mode="union", margin=32, max_tiles=4):
+    """
+    Vùng cần detect của một camera (xyxy, pixel nguyên)
+    - mode "union": một bbox bao tất cả zone
+    - mode "tiles": bbox từng zone, gộp các bbox chồng nhau; nếu vẫn quá max_tiles thì gộp cặp
+      làm tăng diện tích ít nhất
+    Camera không có zone -> cả frame.
+    """
+    height, width = frame_shape[:2]
+    boxes = [_bbox(zone['polygon'], margin, width, height) for zone in zones]
+    boxes = [box for box in boxes if _area(box) > 0]
+    if not boxes:
+        return [(0, 0, width, height)]
+    if mode == "union":
+        box = boxes[0]
+        for other in boxes[1:]:
+            box = _union(box, other)
+        return [box]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                if _overlaps(boxes[i], boxes[j]):
+                    boxes[i] = _union(boxes[i], boxes.pop(j))
+                    merged = True
+                    break
+            if merged:
+                break
+    while len(boxes) > max_tiles:
+        cost, i, j = min((_area(_union(a, b)) - _area(a) - _area(b), i, j)
+                         for i, a in enumerate(boxes) for j, b in enumerate(boxes) if i < j)
+        boxes[i] = _union(boxes[i], boxes.pop(j))
+    return boxes
+
+
+class RoiCropper:
+    """
+    Cắt frame theo vùng zone trước khi đưa vào detector và đưa box về tọa độ frame gốc,
+    nên tracker và DirectionAnalyzer không cần biết frame đã bị cắt.
+    Vùng cắt được tính một lần theo kích thước frame (tính lại nếu kích thước đổi).
+    """
+
+    def __init__(self, zones, mode="union", margin=32, max_tiles=4, merge_iou=0.6):
+        self.zones = zones
+        self.mode = mode
+        self.margin = margin
+        self.max_tiles = max_tiles
+        self.merge_iou = merge_iou
+        self.frame_shape = None
+        self.rois = []
+
+    def set_zones(self, zones):
+        """Đổi zone khi đang chạy (vùng cắt được tính lại ở frame kế tiếp)"""
+        self.zones = zones
+        self.frame_shape = None
+
+    def crops(self, frame):
+        """Các vùng cắt của frame (view, không copy)"""
+        if frame.shape[:2] != self.frame_shape:
+            self.frame_shape = frame.shape[:2]
+            self.rois = zone_rois(self.zones, frame.shape, self.mode, self.margin, self.max_tiles)
+        return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in self.rois]
+
+    def merge(self, detections):
+        """
+        Gộp detection của các vùng cắt (cùng thứ tự với crops) thành một dict tọa độ frame gốc.
+        Box trùng ở phần chồng lấn giữa các tile được lọc bằng NMS theo class.
+        """
+        boxes = np.concatenate([dets['boxes'] + np.array([x1, y1, x1, y1], dtype=dets['boxes'].dtype)
+                                for dets, (x1, y1, _, _) in zip(detections, self.rois)])
+        conf = np.concatenate([dets['conf'] for dets in detections])
+        cls = np.concatenate([dets['cls'] for dets in detections])
+        if len(detections) > 1 and len(boxes) > 1:
+            order = np.argsort(-conf)
+            boxes, conf, cls = boxes[order], conf[order], cls[order]
+            iou = iou_matrix(boxes, boxes)
+            iou[cls[:, None] != cls[None, :]] = 0
+            keep = np.ones(len(boxes), dtype=bool)
+            for i in range(len(boxes)):
+                if keep[i]:
+                    keep[i + 1:] &= iou[i, i + 1:] <= self.merge_iou
+            boxes, conf, cls = boxes[keep], conf[keep], cls[keep]
+        return {'boxes': boxes, 'conf': conf, 'cls': cls}
+
+
+def detect_rois(detector, frames, croppers, conf=0.3, iou=0.5):
+    """
+    Detect một batch frame, frame có cropper chỉ đưa các vùng zone vào model (mọi crop chung một lần gọi)
+    Args:
+        croppers: list cùng độ dài frames, phần tử None = detect cả frame
+    Returns: list dict {'boxes', 'conf', 'cls'} tọa độ frame gốc, cùng thứ tự với frames
+    """
+    inputs, counts = [], []
+    for frame, cropper in zip(frames, croppers):
+        crops = cropper.crops(frame) if cropper is not None else [frame]
+        inputs.extend(crops)
+        counts.append(len(crops))
+    results = detector.detect(inputs, conf=conf, iou=iou)
+    detections = []
+    start = 0
+    for cropper, count in zip(croppers, counts):
+        part = results[start:start + count]
+        start += count
+        detections.append(cropper.merge(part) if cropper is not None else part[0])
+    return detections
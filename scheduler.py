@@ -0,0 +1,165 @@
+import time
+
+
+class FrameScheduler:
+    """
+    Chọn frame cho analyzer khi nhiều camera chia nhau một worker.
+    - Mỗi camera chỉ giữ frame mới nhất đang chờ: frame cũ hơn bị bỏ ngay (trả slot),
+      nên độ trễ không tăng theo backlog khi quá tải
+    - Theo dõi độ trễ end-to-end (thời điểm xử lý - thời điểm đọc) của từng camera
+    - Tổng FPS phân tích (budget) điều chỉnh kiểu AIMD: giảm nhân khi độ trễ vượt target_lag,
+      tăng dần khi đã hồi phục
+    - Budget chia cho các camera theo trọng số (priority * violation_boost khi camera có vi phạm đang mở),
+      không camera nào vượt max_fps hay thấp hơn min_fps
+    - Trong batch, camera được chọn theo stride scheduling nên camera nhiều frame không lấn camera khác
+    """
+
+    def __init__(self, max_fps=15, min_fps=1.0, target_lag=0.5, priorities=None, violation_boost=3.0,
+                 adapt_interval=1.0, decrease=0.8, increase_fps=1.0, smoothing=0.2):
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.target_lag = target_lag
+        self.priorities = priorities or {}
+        self.violation_boost = violation_boost
+        self.adapt_interval = adapt_interval
+        self.decrease = decrease
+        self.increase_fps = increase_fps
+        self.smoothing = smoothing
+        self.cameras = {}  # cam_name -> trạng thái QoS
+        self.budget = None  # Tổng FPS phân tích cho mọi camera, None = chưa có camera
+        self.lag = 0.0  # EWMA độ trễ của cả worker
+        self._last_adapt = time.monotonic()
+        self._rates_dirty = True
+
+    def _camera(self, cam_name):
+        cam = self.cameras.get(cam_name)
+        if cam is None:
+            # Camera mới bắt đầu ở pass nhỏ nhất hiện tại để không chiếm lượt của camera cũ
+            start_pass = min((c['pass'] for c in self.cameras.values()), default=0.0)
+            cam = self.cameras[cam_name] = {
+                'pending': None, 'pass': start_pass, 'active': False, 'rate': self.max_fps,
+                'last_dispatch': 0.0, 'lag': 0.0, 'processed': 0, 'dropped': 0
+            }
+            self.budget = min(self.max_fps * len(self.cameras),
+                              (self.budget or 0.0) + self.max_fps)
+            self._rates_dirty = True
+        return cam
+
+    def weight(self, cam_name):
+        cam = self.cameras[cam_name]
+        weight = self.priorities.get(cam_name, 1.0)
+        return weight * self.violation_boost if cam['active'] else weight
+
+    def offer(self, descriptor):
+        """
+        Nhận descriptor (cam_name, ring, slot, ts, seq, shape) mới từ reader
+        Returns: descriptor cũ bị thay thế (cần trả slot) hoặc None
+        """
+        cam = self._camera(descriptor[0])
+        stale = cam['pending']
+        cam['pending'] = descriptor
+        if stale is not None:
+            cam['dropped'] += 1
+        return stale
+
+    def pending_count(self, cam_name):
+        """Số frame của camera đang chờ vào batch (0 hoặc 1: chỉ giữ frame mới nhất)"""
+        cam = self.cameras.get(cam_name)
+        return int(cam is not None and cam['pending'] is not None)
+
+    def has_pending(self):
+        return any(cam['pending'] is not None for cam in self.cameras.values())
+
+    def _allocate(self):
+        """Chia budget theo trọng số (water-filling): phần vượt max_fps của camera được chia lại cho camera khác"""
+        remaining = self.budget
+        open_cams = set(self.cameras)
+        while open_cams:
+            total = sum(self.weight(c) for c in open_cams)
+            share = {c: remaining * self.weight(c) / total for c in open_cams}
+            capped = [c for c in open_cams if share[c] >= self.max_fps]
+            if not capped:
+                for c in open_cams:
+                    self.cameras[c]['rate'] = max(self.min_fps, share[c])
+                break
+            for c in capped:
+                self.cameras[c]['rate'] = self.max_fps
+                remaining -= self.max_fps
+                open_cams.discard(c)
+        self._rates_dirty = False
+
+    def _ready(self, now):
+        if self._rates_dirty:
+            self._allocate()
+        return [name for name, cam in self.cameras.items()
+                if cam['pending'] is not None and now - cam['last_dispatch'] >= 1.0 / cam['rate']]
+
+    def ready_count(self):
+        return len(self._ready(time.monotonic()))
+
+    def wait_time(self):
+        """Số giây đến khi có camera được phép xử lý frame đang chờ (0 nếu đã có)"""
+        now = time.monotonic()
+        if self._rates_dirty:
+            self._allocate()
+        waits = [cam['last_dispatch'] + 1.0 / cam['rate'] - now
+                 for cam in self.cameras.values() if cam['pending'] is not None]
+        return max(0.0, min(waits)) if waits else None
+
+    def next_batch(self, max_batch):
+        """Lấy tối đa max_batch frame (mỗi camera một frame) theo thứ tự stride scheduling"""
+        now = time.monotonic()
+        ready = sorted(self._ready(now), key=lambda c: self.cameras[c]['pass'])[:max_batch]
+        batch = []
+        for cam_name in ready:
+            cam = self.cameras[cam_name]
+            batch.append(cam['pending'])
+            cam['pending'] = None
+            cam['last_dispatch'] = now
+            cam['pass'] += 1.0 / self.weight(cam_name)
+        return batch
+
+    def record(self, cam_name, ts, violation_active=False):
+        """Ghi nhận một frame đã xử lý xong (ts: thời điểm reader đọc frame, theo time.time())"""
+        cam = self.cameras.get(cam_name)
+        if cam is None:
+            return
+        lag = time.time() - ts
+        cam['lag'] += self.smoothing * (lag - cam['lag'])
+        cam['processed'] += 1
+        self.lag += self.smoothing * (lag - self.lag)
+        if violation_active != cam['active']:
+            cam['active'] = violation_active
+            self._rates_dirty = True
+        now = time.monotonic()
+        if now - self._last_adapt >= self.adapt_interval:
+            self._adapt()
+            self._last_adapt = now
+
+    def _adapt(self):
+        floor = self.min_fps * len(self.cameras)
+        ceiling = self.max_fps * len(self.cameras)
+        if self.lag > self.target_lag:
+            budget = max(floor, self.budget * self.decrease)
+        elif self.lag < self.target_lag / 2:
+            budget = min(ceiling, self.budget + self.increase_fps)
+        else:
+            return
+        if budget != self.budget:
+            self.budget = budget
+            self._rates_dirty = True
+
+    def forget(self, cam_name):
+        """Bỏ trạng thái camera (camera bị gỡ/chuyển worker). Returns: descriptor đang chờ hoặc None"""
+        cam = self.cameras.pop(cam_name, None)
+        if cam is None:
+            return None
+        self.budget = max(0.0, self.budget - cam['rate']) if self.cameras else None
+        self._rates_dirty = True
+        return cam['pending']
+
+    def summary(self):
+        parts = [f"{name}: {cam['rate']:.1f}fps lag {1000 * cam['lag']:.0f}ms drop {cam['dropped']}"
+                 for name, cam in self.cameras.items()]
+        budget = self.budget or 0.0
+        return f"[scheduler] budget {budget:.1f}fps | lag {1000 * self.lag:.0f}ms | " + " | ".join(parts)
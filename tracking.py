@@ -0,0 +1,234 @@
+import numpy as np
+
+
+def empty_tracks():
+    """Kết quả tracking rỗng (cùng format với các tracker engine)"""
+    return {
+        'boxes': np.zeros((0, 4), dtype=np.float32),
+        'track_ids': np.zeros(0, dtype=int),
+        'conf': np.zeros(0, dtype=np.float32),
+        'cls': np.zeros(0, dtype=int),
+    }
+
+
+class ByteTrackEngine:
+    """
+    Tracker ByteTrack/BoT-SORT của ultralytics, chạy tách rời khỏi model.
+    Mỗi camera dùng một instance riêng nên track ID không bị lẫn giữa các stream.
+    """
+
+    def __init__(self, tracker_cfg="bytetrack.yaml"):
+        from ultralytics.engine.results import Boxes
+        from ultralytics.trackers.track import TRACKER_MAP
+        from ultralytics.utils import YAML, IterableSimpleNamespace
+        from ultralytics.utils.checks import check_yaml
+
+        cfg = IterableSimpleNamespace(**YAML.load(check_yaml(tracker_cfg)))
+        self._boxes_cls = Boxes
+        self.tracker = TRACKER_MAP[cfg.tracker_type](args=cfg)
+
+    def update(self, detections, frame):
+        """
+        Gán ID cho các detection của một frame
+        Args:
+            detections: dict {'boxes', 'conf', 'cls'} từ ObjectDetector.detect
+            frame: frame gốc (BoT-SORT cần ảnh cho GMC)
+        Returns: dict {'boxes', 'track_ids', 'conf', 'cls'}
+        """
+        data = np.hstack([
+            detections['boxes'].reshape(-1, 4),
+            detections['conf'].reshape(-1, 1),
+            detections['cls'].reshape(-1, 1),
+        ]).astype(np.float32)
+        tracks = self.tracker.update(self._boxes_cls(data, frame.shape[:2]), frame)
+        if len(tracks) == 0:
+            return empty_tracks()
+        return {
+            'boxes': tracks[:, :4],
+            'track_ids': tracks[:, 4].astype(int),
+            'conf': tracks[:, 5],
+            'cls': tracks[:, 6].astype(int),
+        }
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU giữa mọi cặp box (xyxy) của hai mảng, shape (len(a), len(b))"""
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    iw = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    ih = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = iw * ih
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-9)
+
+
+def center_distance(boxes_a, boxes_b):
+    """Khoảng cách tâm giữa mọi cặp box (xyxy), tính theo cạnh dài của box a, shape (len(a), len(b))"""
+    centers_a = (boxes_a[:, 0:2] + boxes_a[:, 2:4]) / 2
+    centers_b = (boxes_b[:, 0:2] + boxes_b[:, 2:4]) / 2
+    size = np.maximum(boxes_a[:, 2] - boxes_a[:, 0], boxes_a[:, 3] - boxes_a[:, 1])
+    return np.linalg.norm(centers_a[:, None] - centers_b[None], axis=2) / np.maximum(size, 1e-9)[:, None]
+
+
+def greedy_match(iou, threshold):
+    """
+    Ghép track-detection theo điểm giảm dần (IoU, hoặc khoảng cách đổi dấu) thay cho Hungarian, không cần scipy
+    Returns: (row_idx, col_idx) các cặp có điểm >= threshold đã ghép
+    """
+    rows, cols = np.nonzero(iou >= threshold)
+    if len(rows) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    order = np.argsort(-iou[rows, cols], kind="stable")
+    used_rows, used_cols = set(), set()
+    matched_rows, matched_cols = [], []
+    for r, c in zip(rows[order], cols[order]):
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        matched_rows.append(r)
+        matched_cols.append(c)
+    return np.array(matched_rows, dtype=int), np.array(matched_cols, dtype=int)
+
+
+def xyxy_to_cxcywh(boxes):
+    wh = boxes[:, 2:4] - boxes[:, 0:2]
+    return np.hstack([boxes[:, 0:2] + wh / 2, wh])
+
+
+def cxcywh_to_xyxy(state):
+    half = state[:, 2:4] / 2
+    return np.hstack([state[:, 0:2] - half, state[:, 0:2] + half])
+
+
+class IoUKalmanTracker:
+    """
+    Tracker độc lập viết bằng NumPy: Kalman vận tốc không đổi + ghép IoU. Track mới chưa có vận tốc nên
+    còn được ghép theo khoảng cách tâm (tối đa center_gate lần cạnh dài của box): xe di chuyển nhanh so với
+    kích thước box (FPS phân tích thấp) vẫn được xác nhận, từ quan sát thứ hai Kalman đã có vận tốc.
+    Track chưa xác nhận bị bỏ khi lỡ một frame.
+    Toàn bộ track của một camera được predict/update theo dạng vector.
+    Trạng thái mỗi track: [cx, cy, w, h, vx, vy, vw, vh].
+    """
+
+    # Ma trận chuyển trạng thái (dt = 1 frame) và nhiễu quá trình / quan sát
+    F = np.eye(8)
+    F[:4, 4:] = np.eye(4)
+    Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001, 0.0001])
+    R = np.diag([1.0, 1.0, 10.0, 10.0])
+    P0 = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4, 1e4])
+
+    def __init__(self, iou_threshold=0.3, max_age=30, min_hits=3, new_track_conf=0.4, center_gate=1.5):
+        self.iou_threshold = iou_threshold
+        self.center_gate = center_gate
+        self.max_age = max_age  # Số frame không khớp tối đa trước khi xóa track
+        self.min_hits = min_hits  # Số lần khớp tối thiểu để xuất track
+        self.new_track_conf = new_track_conf
+        self.next_id = 1
+        self.x = np.zeros((0, 8))
+        self.P = np.zeros((0, 8, 8))
+        self.ids = np.zeros(0, dtype=int)
+        self.hits = np.zeros(0, dtype=int)
+        self.misses = np.zeros(0, dtype=int)
+        self.cls = np.zeros(0, dtype=int)
+        self.conf = np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def predict(self):
+        """Dự đoán vị trí tất cả track cho frame hiện tại"""
+        self.x = self.x @ self.F.T
+        self.x[:, 2:4] = np.maximum(self.x[:, 2:4], 1.0)
+        self.P = self.F @ self.P @ self.F.T + self.Q
+
+    def _correct(self, idx, z):
+        """Cập nhật Kalman cho các track idx với quan sát z (cx, cy, w, h)"""
+        P = self.P[idx]
+        S = P[:, :4, :4] + self.R
+        K = P[:, :, :4] @ np.linalg.inv(S)
+        y = z - self.x[idx, :4]
+        self.x[idx] += np.einsum('nij,nj->ni', K, y)
+        self.P[idx] = P - K @ P[:, :4, :]
+
+    def _spawn(self, boxes, conf, cls):
+        n = len(boxes)
+        x = np.zeros((n, 8))
+        x[:, :4] = xyxy_to_cxcywh(boxes)
+        self.x = np.vstack([self.x, x])
+        self.P = np.concatenate([self.P, np.repeat(self.P0[None], n, axis=0)])
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + n)])
+        self.next_id += n
+        self.hits = np.concatenate([self.hits, np.ones(n, dtype=int)])
+        self.misses = np.concatenate([self.misses, np.zeros(n, dtype=int)])
+        self.cls = np.concatenate([self.cls, cls.astype(int)])
+        self.conf = np.concatenate([self.conf, conf.astype(np.float32)])
+
+    def _keep(self, mask):
+        for name in ('x', 'P', 'ids', 'hits', 'misses', 'cls', 'conf'):
+            setattr(self, name, getattr(self, name)[mask])
+
+    def update(self, detections, frame=None):
+        """
+        Gán ID cho các detection của một frame
+        Args:
+            detections: dict {'boxes', 'conf', 'cls'} từ ObjectDetector.detect
+            frame: không dùng, giữ cùng interface với ByteTrackEngine
+        Returns: dict {'boxes', 'track_ids', 'conf', 'cls'} các track được khớp ở frame này
+        """
+        det_boxes = np.asarray(detections['boxes'], dtype=np.float64).reshape(-1, 4)
+        det_conf = np.asarray(detections['conf']).reshape(-1)
+        det_cls = np.asarray(detections['cls']).reshape(-1)
+
+        self.predict()
+        track_boxes = cxcywh_to_xyxy(self.x[:, :4])
+        rows, cols = greedy_match(iou_matrix(track_boxes, det_boxes), self.iou_threshold)
+        # Lần 2: track chưa xác nhận (chưa có vận tốc nên dự đoán đứng yên) ghép theo khoảng cách tâm với
+        # detection còn lại; track đã xác nhận chỉ ghép IoU để không nhảy sang xe bên cạnh khi bị che
+        free_tracks = np.setdiff1d(np.flatnonzero(self.hits < self.min_hits), rows)
+        free_dets = np.setdiff1d(np.arange(len(det_boxes)), cols)
+        if len(free_tracks) and len(free_dets):
+            r, c = greedy_match(-center_distance(track_boxes[free_tracks], det_boxes[free_dets]),
+                                -self.center_gate)
+            rows = np.concatenate([rows, free_tracks[r]])
+            cols = np.concatenate([cols, free_dets[c]])
+        self.misses += 1
+        if len(rows):
+            self._correct(rows, xyxy_to_cxcywh(det_boxes[cols]))
+            self.hits[rows] += 1
+            self.misses[rows] = 0
+            self.cls[rows] = det_cls[cols]
+            self.conf[rows] = det_conf[cols]
+
+        # Detection chưa khớp đủ tin cậy -> tạo track mới
+        unmatched = np.ones(len(det_boxes), dtype=bool)
+        unmatched[cols] = False
+        unmatched &= det_conf >= self.new_track_conf
+        if unmatched.any():
+            self._spawn(det_boxes[unmatched], det_conf[unmatched], det_cls[unmatched])
+
+        # Track chưa xác nhận (thường là detection nhiễu) bị bỏ ngay khi lỡ một frame
+        self._keep((self.misses <= self.max_age) & ((self.hits >= self.min_hits) | (self.misses == 0)))
+
+        # Chỉ xuất track vừa khớp và đã xác nhận (hoặc vừa tạo khi min_hits <= 1)
+        out = (self.misses == 0) & (self.hits >= self.min_hits)
+        return {
+            'boxes': cxcywh_to_xyxy(self.x[out, :4]).astype(np.float32),
+            'track_ids': self.ids[out],
+            'conf': self.conf[out],
+            'cls': self.cls[out],
+        }
+
+
+def create_track_engine(engine="iou", **kwargs):
+    """
+    Tạo bộ gán ID cho một camera
+    Args:
+        engine: "iou" (IoUKalmanTracker, chỉ cần NumPy) hoặc "bytetrack"/"botsort" (ultralytics)
+    """
+    if engine == "iou":
+        return IoUKalmanTracker(**kwargs)
+    if engine in ("bytetrack", "botsort"):
+        return ByteTrackEngine(f"{engine}.yaml", **kwargs)
+    raise ValueError(f"Tracker engine không hỗ trợ: {engine}")
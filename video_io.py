@@ -0,0 +1,437 @@
+import os
+import cv2
+import time
+import random
+import shutil
+import threading
+import subprocess
+import importlib.util
+import numpy as np
+from queue import Queue
+import metrics
+
+
+class FileVideoReader:
+    """
+    Đọc file video tuần tự trên thread nền (decode song song với inference).
+    Frame được decode thẳng vào ring buffer cấp phát sẵn, không seek, không cấp phát mới.
+
+    Cách dùng:
+        reader = FileVideoReader(path, target_fps=10)
+        for frame_idx, ts, frame in reader:
+            ...  # frame chỉ hợp lệ đến vòng lặp kế tiếp (slot được trả lại ring)
+    """
+
+    def __init__(self, path, buffer_size=8, target_fps=None):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Không mở được video {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        # Chỉ phân tích 1 trên mỗi `stride` frame để đạt FPS phân tích mục tiêu
+        self.stride = max(1, int(round(self.fps / target_fps))) if target_fps else 1
+        self.output_fps = self.fps / self.stride
+        self._frames = np.empty((buffer_size, self.height, self.width, 3), dtype=np.uint8)
+        self._free = Queue()
+        for slot in range(buffer_size):
+            self._free.put(slot)
+        self._filled = Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self._thread.start()
+
+    def _decode_loop(self):
+        frame_idx = 0
+        camera = os.path.basename(self.path)
+        try:
+            while not self._stop.is_set():
+                # Frame bị bỏ qua: chỉ grab, không chuyển sang BGR
+                if frame_idx % self.stride:
+                    if not self.cap.grab():
+                        break
+                    frame_idx += 1
+                    continue
+                slot = self._free.get()
+                if slot is None:
+                    break
+                buf = self._frames[slot]
+                start = time.perf_counter()
+                ret, frame = self.cap.read(buf)
+                metrics.observe("decode", time.perf_counter() - start, camera=camera)
+                if not ret:
+                    break
+                if frame is not buf:
+                    # Frame khác kích thước khai báo của container
+                    buf[:] = cv2.resize(frame, (self.width, self.height))
+                # Timestamp lấy từ PTS của container
+                ts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                if ts < 0:
+                    ts = frame_idx / self.fps
+                self._filled.put((slot, frame_idx, ts))
+                frame_idx += 1
+        finally:
+            self.cap.release()
+            self._filled.put(None)
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self._filled.get()
+                if item is None:
+                    break
+                slot, frame_idx, ts = item
+                yield frame_idx, ts, self._frames[slot]
+                # Vòng lặp đã xử lý xong frame -> trả slot cho thread decode
+                self._free.put(slot)
+        finally:
+            self.close()
+
+    def close(self):
+        """Dừng thread decode (có thể gọi khi thoát vòng lặp sớm)"""
+        self._stop.set()
+        self._free.put(None)
+        self._thread.join()
+
+
+def output_size(source_size, width=None):
+    """Kích thước decode (w, h): giữ tỉ lệ khung hình, rộng width px (None = giữ nguyên), h chẵn"""
+    src_w, src_h = source_size
+    if not width or width >= src_w:
+        return src_w, src_h
+    return width, max(2, int(round(src_h * width / src_w / 2)) * 2)
+
+
+class OpenCVCapture:
+    """
+    Backend cv2.VideoCapture (FFmpeg của OpenCV), thử bật giải mã phần cứng nếu OpenCV hỗ trợ.
+    Không decode thẳng ra kích thước nhỏ được: frame được resize sau khi decode.
+    """
+
+    def __init__(self, url, width=None, keyframes_only=False, fps=None):
+        self.url = url
+        self.width = width
+        self.cap = None
+        self.source_size = None
+        self.size = None
+        self._scratch = None
+
+    def open(self):
+        params = []
+        if hasattr(cv2, "CAP_PROP_HW_ACCELERATION"):
+            params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        self.cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG, params)
+        if not self.cap.isOpened():
+            return False
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.source_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                            int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.size = output_size(self.source_size, self.width)
+        return True
+
+    def read(self, out=None):
+        if self.size == self.source_size:
+            return self.cap.read(out)
+        ret, self._scratch = self.cap.read(self._scratch)
+        if not ret:
+            return False, None
+        return True, cv2.resize(self._scratch, self.size, dst=out, interpolation=cv2.INTER_AREA)
+
+    def grab(self):
+        return self.cap.grab()
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class FFmpegCapture:
+    """
+    Backend process ffmpeg: decode (có -hwaccel), scale về kích thước nhỏ, giới hạn FPS và chỉ lấy keyframe
+    đều làm trong ffmpeg; frame BGR thô đọc thẳng từ pipe vào buffer đích (vd slot shared memory).
+    Cờ low-delay/nobuffer giữ độ trễ thấp; cần ffmpeg và ffprobe trong PATH.
+    Camera im lặng mà không đóng kết nối: watchdog kill ffmpeg khi không có dữ liệu quá read_timeout giây,
+    read() trả về lỗi và ReconnectingStream kết nối lại thay vì treo mãi.
+    """
+
+    def __init__(self, url, width=None, keyframes_only=False, fps=None, hwaccel="auto", read_timeout=10.0):
+        self.url = url
+        self.width = width
+        self.keyframes_only = keyframes_only
+        self.fps = fps
+        self.hwaccel = hwaccel
+        self.read_timeout = read_timeout
+        self.proc = None
+        self._last_data = 0.0
+        self.source_size = None
+        self.size = None
+        self._scratch = None
+
+    def _input_options(self):
+        return ["-rtsp_transport", "tcp"] if self.url.startswith("rtsp") else []
+
+    def _probe(self):
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", *self._input_options(), "-select_streams", "v:0",
+             "-show_entries", "stream=width,height", "-of", "csv=p=0", self.url],
+            capture_output=True, text=True, timeout=15)
+        width, height = out.stdout.strip().split(",")[:2]
+        return int(width), int(height)
+
+    def open(self):
+        # Thiếu ffmpeg/ffprobe (OSError) được coi như lỗi kết nối; check_backend báo lỗi rõ ràng lúc khởi động
+        try:
+            self.source_size = self._probe()
+        except (subprocess.TimeoutExpired, ValueError, OSError):
+            return False
+        self.size = output_size(self.source_size, self.width)
+        cmd = ["ffmpeg", "-loglevel", "error", *self._input_options(),
+               "-fflags", "nobuffer", "-flags", "low_delay"]
+        if self.hwaccel:
+            cmd += ["-hwaccel", self.hwaccel]
+        if self.keyframes_only:
+            cmd += ["-skip_frame", "nokey"]
+        cmd += ["-i", self.url, "-an"]
+        filters = []
+        if self.fps and not self.keyframes_only:
+            filters.append(f"fps={self.fps}")
+        if self.size != self.source_size:
+            filters.append(f"scale={self.size[0]}:{self.size[1]}")
+        if filters:
+            cmd += ["-vf", ",".join(filters)]
+        if self.keyframes_only:
+            cmd += ["-vsync", "passthrough"]
+        cmd += ["-pix_fmt", "bgr24", "-f", "rawvideo", "pipe:1"]
+        try:
+            self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stdin=subprocess.DEVNULL, bufsize=0)
+        except OSError:
+            return False
+        self._scratch = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        self._last_data = time.monotonic()
+        threading.Thread(target=self._watchdog, args=(self.proc,), daemon=True).start()
+        return True
+
+    def _watchdog(self, proc):
+        """Kill ffmpeg nếu pipe không có dữ liệu quá read_timeout giây (readinto đang chặn sẽ trả về 0)"""
+        while proc.poll() is None:
+            time.sleep(min(1.0, self.read_timeout / 4))
+            if proc is self.proc and time.monotonic() - self._last_data > self.read_timeout:
+                proc.kill()
+                break
+
+    def read(self, out=None):
+        if out is None:
+            out = np.empty_like(self._scratch)
+        # Đọc thẳng vào buffer đích nếu đúng kích thước, không thì đọc tạm rồi resize
+        target = out if out.shape == self._scratch.shape else self._scratch
+        view = memoryview(target.reshape(-1))
+        filled = 0
+        while filled < len(view):
+            n = self.proc.stdout.readinto(view[filled:])
+            if not n:
+                return False, None
+            filled += n
+            self._last_data = time.monotonic()
+        if target is not out:
+            cv2.resize(target, (out.shape[1], out.shape[0]), dst=out)
+        return True, out
+
+    def grab(self):
+        # Vẫn phải đọc hết frame khỏi pipe để ffmpeg không bị chặn
+        return self.read(self._scratch)[0]
+
+    def release(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+
+class PyAVCapture:
+    """
+    Backend PyAV (libav trong process): decode đa luồng, có thể bỏ frame không phải keyframe ngay
+    ở decoder; chỉ frame được lấy mới chuyển sang BGR (kèm scale), frame thừa theo fps chỉ decode.
+    """
+
+    def __init__(self, url, width=None, keyframes_only=False, fps=None):
+        self.url = url
+        self.width = width
+        self.keyframes_only = keyframes_only
+        self.fps = fps
+        self.container = None
+        self.source_size = None
+        self.size = None
+        self._frames = None
+        self._next_pts = None
+
+    def open(self):
+        import av
+
+        try:
+            self.container = av.open(self.url, options={"rtsp_transport": "tcp", "fflags": "nobuffer",
+                                                        "flags": "low_delay"}, timeout=10)
+        except (av.error.FFmpegError, OSError):
+            return False
+        stream = self.container.streams.video[0]
+        stream.thread_type = "AUTO"
+        if self.keyframes_only:
+            stream.codec_context.skip_frame = "NONKEY"
+        self.source_size = (stream.codec_context.width, stream.codec_context.height)
+        self.size = output_size(self.source_size, self.width)
+        self._frames = self.container.decode(stream)
+        self._next_pts = None
+        return True
+
+    def _next_frame(self):
+        """Frame decode kế tiếp đến hạn theo fps (None khi hết stream/lỗi)"""
+        import av
+
+        try:
+            for frame in self._frames:
+                t = frame.time
+                if self.fps and t is not None and self._next_pts is not None and t < self._next_pts:
+                    continue
+                if self.fps and t is not None:
+                    self._next_pts = t + 1.0 / self.fps
+                return frame
+        except (av.error.FFmpegError, OSError):
+            pass
+        return None
+
+    def read(self, out=None):
+        frame = self._next_frame()
+        if frame is None:
+            return False, None
+        image = frame.to_ndarray(format="bgr24", width=self.size[0], height=self.size[1])
+        if out is None:
+            return True, image
+        if out.shape != image.shape:
+            cv2.resize(image, (out.shape[1], out.shape[0]), dst=out)
+        else:
+            np.copyto(out, image)
+        return True, out
+
+    def grab(self):
+        return self._next_frame() is not None
+
+    def release(self):
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+
+CAPTURE_BACKENDS = {"opencv": OpenCVCapture, "ffmpeg": FFmpegCapture, "pyav": PyAVCapture}
+
+
+def check_backend(backend):
+    """
+    Kiểm tra backend capture dùng được trên máy này (gọi một lần lúc khởi động, trước khi chạy reader)
+    Raises: ValueError nếu không có backend này, RuntimeError nếu thiếu ffmpeg/ffprobe hoặc PyAV
+    """
+    if backend not in CAPTURE_BACKENDS:
+        raise ValueError(f"CAPTURE_BACKEND không hợp lệ: {backend!r} (chọn một trong {list(CAPTURE_BACKENDS)})")
+    if backend == "ffmpeg":
+        missing = [tool for tool in ("ffmpeg", "ffprobe") if shutil.which(tool) is None]
+        if missing:
+            raise RuntimeError(f"Backend ffmpeg cần {' và '.join(missing)} trong PATH")
+    elif backend == "pyav" and importlib.util.find_spec("av") is None:
+        raise RuntimeError("Backend pyav cần PyAV (pip install av)")
+
+
+class ReconnectingStream:
+    """
+    Nguồn RTSP tự kết nối lại: lỗi mở/đọc -> chờ theo backoff lũy thừa có jitter
+    (base_delay * 2^lần lỗi, tối đa max_delay, chờ ngẫu nhiên trong [delay/2, delay]) rồi mở lại,
+    tránh nhiều camera cùng dồn kết nối lại một lúc. Theo dõi tình trạng stream qua health().
+    """
+
+    def __init__(self, url, name, backend="opencv", width=None, keyframes_only=False, fps=None,
+                 base_delay=0.5, max_delay=30.0):
+        self.url = url
+        self.name = name
+        self.capture = CAPTURE_BACKENDS[backend](url, width=width, keyframes_only=keyframes_only, fps=fps)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.connected = False
+        self.failures = 0  # Số lần lỗi liên tiếp
+        self.reconnects = 0
+        self.frames = 0
+        self.last_error = None
+        self.last_frame_time = None
+        self.fps = 0.0  # EWMA FPS nhận được
+
+    @property
+    def source_size(self):
+        return self.capture.source_size
+
+    def _connect(self):
+        if self.connected:
+            return True
+        if self.capture.open():
+            self.connected = True
+            metrics.set_gauge("stream_up", 1, camera=self.name)
+            return True
+        self._fail("không mở được stream")
+        return False
+
+    def _fail(self, error):
+        self.capture.release()
+        if self.connected:
+            self.reconnects += 1
+            metrics.inc("stream_reconnects_total", camera=self.name)
+        self.connected = False
+        self.failures += 1
+        self.last_error = error
+        metrics.set_gauge("stream_up", 0, camera=self.name)
+        delay = min(self.max_delay, self.base_delay * 2 ** (self.failures - 1))
+        delay = random.uniform(delay / 2, delay)
+        print(f"[{self.name}] {error}, thử lại sau {delay:.1f}s (lần {self.failures})")
+        time.sleep(delay)
+
+    def _ok(self):
+        now = time.monotonic()
+        if self.last_frame_time is not None and now > self.last_frame_time:
+            self.fps += 0.1 * (1.0 / (now - self.last_frame_time) - self.fps)
+        self.last_frame_time = now
+        self.frames += 1
+        self.failures = 0
+
+    def read(self, out=None):
+        """Đọc một frame; lỗi -> (False, None) sau khi đã chờ backoff, lần gọi sau sẽ kết nối lại"""
+        if not self._connect():
+            return False, None
+        ret, frame = self.capture.read(out)
+        if not ret:
+            self._fail("không đọc được frame")
+            return False, None
+        self._ok()
+        return True, frame
+
+    def grab(self):
+        """Bỏ qua một frame (không chuyển đổi màu/kích thước)"""
+        if not self._connect():
+            return False
+        if not self.capture.grab():
+            self._fail("không đọc được frame")
+            return False
+        self._ok()
+        return True
+
+    def health(self):
+        age = time.monotonic() - self.last_frame_time if self.last_frame_time is not None else None
+        return {
+            'camera': self.name,
+            'connected': self.connected,
+            'frames': self.frames,
+            'fps': round(self.fps, 2),
+            'reconnects': self.reconnects,
+            'consecutive_failures': self.failures,
+            'last_frame_age': round(age, 2) if age is not None else None,
+            'last_error': self.last_error
+        }
+
+    def release(self):
+        self.capture.release()
+        self.connected = False
@@ -0,0 +1,81 @@
+class ViolationStateMachine:
+    """
+    Gộp vi phạm theo episode cho một camera, khóa theo (track_id, zone).
+    - Vào vi phạm khi sai chiều enter_frames frame liên tiếp -> phát event "open"
+    - Thoát khi không còn sai chiều exit_frames frame liên tiếp -> phát event "closed"
+      (kèm thời điểm bắt đầu/kết thúc, số frame vi phạm và confidence cao nhất)
+    Nhờ vậy một xe đi ngược chiều chỉ tạo một episode thay vì một bản ghi mỗi frame.
+    """
+
+    def __init__(self, cam_name, enter_frames=3, exit_frames=5, error="wrong_way"):
+        self.cam_name = cam_name
+        self.enter_frames = enter_frames
+        self.exit_frames = exit_frames
+        self.error = error
+        self.episodes = {}  # (track_id, zone_id) -> trạng thái episode
+
+    def _event(self, key, episode, status):
+        track_id, zone_id = key
+        return {
+            "camera": self.cam_name,
+            "timestamp": episode['start_ts'],
+            "error": self.error,
+            "track_id": track_id,
+            "zone": zone_id,
+            "status": status,
+            "start_ts": episode['start_ts'],
+            "end_ts": episode['end_ts'],
+            "frames": episode['frames'],
+            "peak_conf": round(episode['peak_conf'], 3)
+        }
+
+    def update(self, ts, track_ids, zone_ids, flags, conf):
+        """
+        Cập nhật trạng thái với kết quả một frame
+        Args:
+            track_ids, zone_ids, flags, conf: mảng (N,) cho mọi track của frame
+                                             (flags: track đang vi phạm hay không)
+        Returns: list event phát sinh ở frame này
+        """
+        events = []
+        seen = set()
+        for track_id, zone_id, c in zip(track_ids[flags].tolist(), zone_ids[flags].tolist(),
+                                        conf[flags].tolist()):
+            key = (track_id, zone_id)
+            seen.add(key)
+            episode = self.episodes.get(key)
+            if episode is None:
+                episode = self.episodes[key] = {
+                    'active': False, 'hits': 0, 'misses': 0,
+                    'start_ts': ts, 'end_ts': ts, 'frames': 0, 'peak_conf': 0.0
+                }
+            episode['hits'] += 1
+            episode['misses'] = 0
+            episode['frames'] += 1
+            episode['end_ts'] = ts
+            episode['peak_conf'] = max(episode['peak_conf'], c)
+            if not episode['active'] and episode['hits'] >= self.enter_frames:
+                episode['active'] = True
+                events.append(self._event(key, episode, "open"))
+
+        for key in [key for key in self.episodes if key not in seen]:
+            episode = self.episodes[key]
+            episode['misses'] += 1
+            if not episode['active']:
+                # Chưa đủ số frame liên tiếp -> coi là nhiễu
+                del self.episodes[key]
+            elif episode['misses'] >= self.exit_frames:
+                events.append(self._event(key, episode, "closed"))
+                del self.episodes[key]
+        return events
+
+    def has_active(self):
+        """Camera có episode vi phạm đang mở hay không"""
+        return any(episode['active'] for episode in self.episodes.values())
+
+    def flush(self):
+        """Đóng mọi episode đang mở (khi kết thúc video/stream)"""
+        events = [self._event(key, episode, "closed")
+                  for key, episode in self.episodes.items() if episode['active']]
+        self.episodes = {}
+        return events
@@ -0,0 +1,61 @@
+import bisect
+import math
+import zlib
+
+
+def stable_hash(key):
+    """Hash ổn định giữa các process (hash() của Python bị ngẫu nhiên hóa theo process)"""
+    return zlib.crc32(str(key).encode("utf-8"))
+
+
+class HashRing:
+    """Consistent hashing với node ảo: thêm/bớt worker chỉ làm dịch chuyển ít camera"""
+
+    def __init__(self, nodes, replicas=100):
+        self.replicas = replicas
+        self._ring = []
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        for r in range(self.replicas):
+            bisect.insort(self._ring, (stable_hash(f"{node}#{r}"), node))
+
+    def remove_node(self, node):
+        self._ring = [(h, n) for h, n in self._ring if n != node]
+
+    def preference(self, key):
+        """Các node theo thứ tự ưu tiên cho key (duyệt theo chiều kim đồng hồ trên ring)"""
+        if not self._ring:
+            return []
+        start = bisect.bisect(self._ring, (stable_hash(key),))
+        seen = []
+        for i in range(len(self._ring)):
+            node = self._ring[(start + i) % len(self._ring)][1]
+            if node not in seen:
+                seen.append(node)
+        return seen
+
+
+def assign_cameras(cameras, workers, load_factor=1.0, replicas=100):
+    """
+    Gán camera -> worker bằng consistent hashing có giới hạn tải:
+    mỗi camera về worker ưu tiên của nó trừ khi worker đó đã đủ ceil(load_factor * C / W) camera.
+    Kết quả chỉ phụ thuộc tập camera/worker nên mọi lần tính lại đều ổn định,
+    thêm/bớt camera chỉ làm vài camera khác đổi worker.
+    Returns: dict cam_name -> worker
+    """
+    workers = list(workers)
+    if not workers:
+        return {}
+    ring = HashRing(workers, replicas=replicas)
+    capacity = max(1, math.ceil(load_factor * len(cameras) / len(workers)))
+    load = {worker: 0 for worker in workers}
+    assignment = {}
+    for cam_name in sorted(cameras, key=lambda c: (stable_hash(c), c)):
+        for worker in ring.preference(cam_name):
+            if load[worker] < capacity:
+                assignment[cam_name] = worker
+                load[worker] += 1
+                break
+    return assignment
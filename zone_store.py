@@ -0,0 +1,227 @@
+import os
+import json
+import math
+import time
+import threading
+from urllib.parse import unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIRECTIONS = ("up", "down")  # Hướng được phép của zone (draw_zone.ipynb: phím '+' / '-')
+
+
+def validate_zones(cam_name, zones):
+    """
+    Kiểm tra danh sách zone của một camera theo định dạng polygons.json
+    Raises: ValueError mô tả zone sai đầu tiên
+    """
+    if not isinstance(zones, list):
+        raise ValueError(f"{cam_name}: danh sách zone phải là list")
+    for i, zone in enumerate(zones):
+        where = f"{cam_name} zone {i}"
+        if not isinstance(zone, dict) or "points" not in zone or "direction" not in zone:
+            raise ValueError(f"{where}: cần có 'points' và 'direction'")
+        if zone['direction'] not in DIRECTIONS:
+            raise ValueError(f"{where}: direction phải là một trong {DIRECTIONS}")
+        points = zone['points']
+        if not isinstance(points, list) or len(points) < 3:
+            raise ValueError(f"{where}: polygon cần ít nhất 3 điểm")
+        for pt in points:
+            if (not isinstance(pt, (list, tuple)) or len(pt) != 2
+                    or not all(isinstance(v, (int, float)) and not isinstance(v, bool)
+                               and math.isfinite(v) and v >= 0 for v in pt)):
+                raise ValueError(f"{where}: điểm không hợp lệ {pt!r}")
+        area = sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1])) / 2
+        if abs(area) < 1:
+            raise ValueError(f"{where}: polygon có diện tích bằng 0")
+
+
+def validate_polygons(polygons):
+    """Kiểm tra toàn bộ cấu hình zone ({camera: [zone, ...]})"""
+    if not isinstance(polygons, dict):
+        raise ValueError("Cấu hình zone phải là object {camera: [zone, ...]}")
+    for cam_name, zones in polygons.items():
+        validate_zones(cam_name, zones)
+
+
+class ZoneStore:
+    """
+    Cấu hình zone đọc từ polygons.json, nạp lại khi file đổi mà không cần khởi động lại stream.
+    - poll(): gọi trong vòng lặp của worker, so (mtime, kích thước) của file tối đa mỗi poll_seconds;
+      file không hợp lệ (đang ghi dở, JSON sai, polygon sai) thì giữ cấu hình cũ và thử lại khi file đổi tiếp
+    - update()/replace(): sửa cấu hình (API HTTP), kiểm tra rồi ghi file nguyên tử (file tạm + os.replace)
+      nên mọi process đang poll cùng file đều nhận cấu hình mới
+    polygons luôn là một dict hoàn chỉnh đã kiểm tra (đổi cả object, không sửa tại chỗ);
+    version tăng mỗi lần cấu hình của process đổi.
+    fallback: cấu hình hợp lệ trước đó (process được khởi động lại khi file đang lỗi) - dùng tạm cho đến khi
+    file được sửa; không có fallback thì file lỗi làm __init__ raise.
+    """
+
+    def __init__(self, path="polygons.json", poll_seconds=1.0, fallback=None):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.version = 0
+        self._lock = threading.Lock()
+        self._next_poll = time.monotonic() + poll_seconds
+        self._rejected = None  # (mtime, kích thước) của bản file lỗi đã báo
+        self._signature = None
+        self.polygons = None
+        signature = None
+        try:
+            signature = self._stat()
+            polygons = self._read()
+        except (OSError, ValueError) as e:
+            if fallback is None:
+                raise  # Lúc khởi động: dừng luôn, như khi đọc polygons.json trực tiếp
+            print(f"[zones] bỏ qua {self.path} ({e}), dùng cấu hình hợp lệ trước đó")
+            self._rejected = signature
+            self.polygons = fallback
+        else:
+            self._signature = signature
+            self.polygons = polygons
+        self.version = 1
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def _read(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            polygons = json.load(f)
+        validate_polygons(polygons)
+        return polygons
+
+    def _set(self, polygons, signature):
+        self._signature = signature
+        if polygons == self.polygons:
+            return False
+        self.polygons = polygons
+        self.version += 1
+        return True
+
+    def poll(self, force=False):
+        """
+        Nạp lại file nếu đã đổi (force: kiểm tra ngay, không chờ poll_seconds)
+        Returns: True nếu cấu hình vừa đổi
+        """
+        now = time.monotonic()
+        if not force and now < self._next_poll:
+            return False
+        self._next_poll = now + self.poll_seconds
+        with self._lock:
+            try:
+                signature = self._stat()
+            except OSError:
+                return False  # File đang được thay thế
+            if signature in (self._signature, self._rejected):
+                return False
+            try:
+                polygons = self._read()
+            except (OSError, ValueError) as e:  # JSONDecodeError là ValueError
+                self._rejected = signature
+                print(f"[zones] bỏ qua {self.path} ({e}), giữ cấu hình cũ")
+                return False
+            changed = self._set(polygons, signature)
+        if changed:
+            print(f"[zones] nạp lại {self.path} (version {self.version})")
+        return changed
+
+    def _write(self, polygons):
+        tmp = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(polygons, f, indent=2)
+        os.replace(tmp, self.path)
+        self._set(polygons, self._stat())
+
+    def update(self, cam_name, zones):
+        """
+        Thay zone của một camera (zones = None để xóa camera)
+        Returns: version sau khi ghi
+        """
+        if zones is not None:
+            validate_zones(cam_name, zones)
+        self.poll(force=True)  # Không ghi đè thay đổi vừa được sửa trực tiếp trong file
+        with self._lock:
+            polygons = dict(self.polygons)
+            if zones is None:
+                polygons.pop(cam_name, None)
+            else:
+                polygons[cam_name] = zones
+            self._write(polygons)
+            return self.version
+
+    def replace(self, polygons):
+        """Thay toàn bộ cấu hình; Returns: version sau khi ghi"""
+        validate_polygons(polygons)
+        with self._lock:
+            self._write(polygons)
+            return self.version
+
+    def serve(self, port=9101, host="127.0.0.1"):
+        """
+        API HTTP cục bộ (thread nền), body JSON theo định dạng polygons.json:
+        - GET /zones, GET /zones/<camera>
+        - PUT /zones (toàn bộ), PUT /zones/<camera> (list zone), DELETE /zones/<camera>
+        Dữ liệu sai trả về 400 kèm lỗi, file không bị đổi.
+        """
+        store = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, code, body):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _target(self):
+                """(đúng đường dẫn /zones hay không, tên camera hoặc None)"""
+                parts = self.path.split("?")[0].strip("/").split("/", 1)
+                if parts[0] != "zones":
+                    return False, None
+                return True, unquote(parts[1]) if len(parts) > 1 and parts[1] else None
+
+            def do_GET(self):
+                ok, cam_name = self._target()
+                store.poll(force=True)
+                polygons = store.polygons
+                if not ok or (cam_name is not None and cam_name not in polygons):
+                    self.send_error(404)
+                elif cam_name is None:
+                    self._send(200, {'version': store.version, 'polygons': polygons})
+                else:
+                    self._send(200, {'version': store.version, 'camera': cam_name, 'zones': polygons[cam_name]})
+
+            def do_PUT(self):
+                ok, cam_name = self._target()
+                if not ok:
+                    self.send_error(404)
+                    return
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+                    if body is None:
+                        raise ValueError("Thiếu body JSON")
+                    if cam_name is None:
+                        version = store.replace(body)
+                    else:
+                        version = store.update(cam_name, body)
+                except ValueError as e:
+                    self._send(400, {'error': str(e)})
+                    return
+                self._send(200, {'version': version})
+
+            do_POST = do_PUT
+
+            def do_DELETE(self):
+                ok, cam_name = self._target()
+                if not ok or cam_name is None:
+                    self.send_error(404)
+                    return
+                self._send(200, {'version': store.update(cam_name, None)})
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server